@@ -1,183 +1,3244 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header, Query, Response, BackgroundTasks
+from fastapi.responses import RedirectResponse, StreamingResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Route
+from starlette.convertors import Convertor, register_url_convertor
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import List, Optional, Dict, Set
 import uuid
+import asyncio
+import json
+import io
+import math
+import time
 from datetime import datetime, timezone, timedelta
 import hashlib
+import base64
+import hmac
 import secrets
+import csv
+import gzip
+import shutil
 import jwt
 from passlib.context import CryptContext
 import string
 import random
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from abc import ABC, abstractmethod
+import sqlite3
+import multiprocessing
+import socket
+import ipaddress
+import fcntl
+import itertools
+import sys
+import threading
+import traceback
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+from urllib.parse import quote, urlsplit, urlunsplit
 from user_agents import parse
+import qrcode
+from PIL import Image
+from pymongo import CursorType, UpdateOne, ReplaceOne, ReturnDocument
+from pymongo.errors import CollectionInvalid, PyMongoError
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Storage backend: "mongo" or the embedded "sqlite" engine
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', str(ROOT_DIR / 'besturl.db'))
+
+# MongoDB connection, also used by the mongo live broker and rate limit backend
+if STORAGE_BACKEND == 'mongo' or os.environ.get('MONGO_URL'):
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+else:
+    client = None
+    db = None
 
 # JWT Config
 SECRET_KEY = os.environ.get('JWT_SECRET', secrets.token_hex(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
+# EventSource and <img> cannot send headers, so they get a short-lived token
+# for one link in the query string instead of the session token
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.environ.get('STREAM_TOKEN_EXPIRE_SECONDS', '60'))
+
+# Unlock tokens let repeat visits to password-protected links skip bcrypt
+UNLOCK_KEY = hashlib.sha256(f"unlock:{SECRET_KEY}".encode()).digest()
+UNLOCK_TOKEN_EXPIRE_SECONDS = int(os.environ.get('UNLOCK_TOKEN_EXPIRE_SECONDS', str(12 * 3600)))
+UNLOCK_COOKIE = "bu_unlock"
+
+# Redirect hot path
+UA_CACHE_SIZE = int(os.environ.get('UA_CACHE_SIZE', '4096'))
+REDIRECT_FAST_PATH = os.environ.get('REDIRECT_FAST_PATH', 'true').lower() == 'true'
+
+# Password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Create the main app
+app = FastAPI(title="LinkShortTR API")
+
+# Create a router with the /api prefix
+api_router = APIRouter(prefix="/api")
+
+# Logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# ==================== MODELS ====================
+
+class UserBase(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    username: str
+    email: str
+
+class UserCreate(BaseModel):
+    username: str
+    email: str
+    password: str
+
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
+class User(UserBase):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    is_admin: bool = False
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    is_active: bool = True
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+    user: dict
+
+class LinkCreate(BaseModel):
+    original_url: str
+    custom_slug: Optional[str] = None
+    title: Optional[str] = None
+    password: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    generate_qr: bool = False
+    # Return the caller's existing link for the same destination instead of a new one
+    reuse_existing: bool = False
+
+class LinkUpdate(BaseModel):
+    title: Optional[str] = None
+    password: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    is_active: Optional[bool] = None
+
+class Link(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    original_url: str
+    short_code: str
+    title: Optional[str] = None
+    password_hash: Optional[str] = None
+    password_version: int = 0
+    expires_at: Optional[datetime] = None
+    is_active: bool = True
+    click_count: int = 0
+    duplicate_hits: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    qr_code: Optional[str] = None
+    url_hash: Optional[str] = None
+
+class ClickEvent(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    link_id: str
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    device_type: str = "unknown"
+    browser: str = "unknown"
+    os: str = "unknown"
+    country: Optional[str] = None
+    city: Optional[str] = None
+    referrer: Optional[str] = None
+
+class LinkBulkCreate(BaseModel):
+    links: List[LinkCreate]
+    reuse_existing: bool = False
+
+class LinkPasswordVerify(BaseModel):
+    password: str
+
+class AnalyticsBatchRequest(BaseModel):
+    # Either explicit ids or the same filters as /links/search
+    link_ids: Optional[List[str]] = None
+    q: Optional[str] = Field(None, max_length=200)
+    active: Optional[bool] = None
+    expired: Optional[bool] = None
+    protected: Optional[bool] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    slow_ms: Optional[float] = Field(None, gt=0)
+    loop_lag_ms: Optional[float] = Field(None, gt=0)
+
+# ==================== STORAGE ====================
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_username(self, username: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def exists(self, username: str, email: str) -> bool: ...
+
+    @abstractmethod
+    async def insert(self, user: dict): ...
+
+    @abstractmethod
+    async def list(self, limit: int = 1000) -> List[dict]: ...
+
+    @abstractmethod
+    async def update(self, user_id: str, fields: dict): ...
+
+    @abstractmethod
+    async def delete(self, user_id: str): ...
+
+    @abstractmethod
+    async def count(self) -> int: ...
+
+class LinkRepository(ABC):
+    @abstractmethod
+    async def get(self, link_id: str, user_id: Optional[str] = None) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_short_code(self, short_code: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_many(self, link_ids: List[str], user_id: str) -> List[dict]: ...
+
+    @abstractmethod
+    async def short_code_exists(self, short_code: str) -> bool: ...
+
+    @abstractmethod
+    async def find_reusable(self, user_id: str, url_hash: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def insert(self, link: dict): ...
+
+    @abstractmethod
+    async def list_by_user(self, user_id: str, limit: int = 1000) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_keys_by_user(self, user_id: str) -> List[dict]: ...
+
+    @abstractmethod
+    async def search(
+        self,
+        user_id: str,
+        text: Optional[str] = None,
+        active: Optional[bool] = None,
+        expired: Optional[bool] = None,
+        protected: Optional[bool] = None,
+        after: Optional[list] = None,
+        limit: int = 50
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def update(self, link_id: str, fields: dict): ...
+
+    @abstractmethod
+    async def increment_clicks(self, link_id: str, amount: int = 1): ...
+
+    @abstractmethod
+    async def add_duplicate_hits(self, hits: Dict[str, int]): ...
+
+    @abstractmethod
+    async def increment_clicks_bulk(self, counts: Dict[str, int]): ...
+
+    @abstractmethod
+    async def list_page(self, after_id: Optional[str] = None, limit: int = 1000) -> List[dict]: ...
+
+    @abstractmethod
+    async def delete(self, link_id: str, user_id: str) -> bool: ...
+
+    @abstractmethod
+    async def delete_by_user(self, user_id: str): ...
+
+    @abstractmethod
+    async def count(self, user_id: Optional[str] = None, created_since: Optional[str] = None) -> int: ...
+
+class ClickRepository(ABC):
+    @abstractmethod
+    async def insert(self, click: dict): ...
+
+    @abstractmethod
+    async def insert_missing(self, clicks: List[dict]) -> Dict[str, int]: ...
+
+    @abstractmethod
+    async def list_for_link(self, link_id: str, limit: Optional[int] = 10000, since: Optional[str] = None, until: Optional[str] = None) -> List[dict]: ...
+
+    @abstractmethod
+    async def page(
+        self,
+        link_id: str,
+        filters: Dict[str, Optional[str]],
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        before: Optional[list] = None,
+        limit: int = 50
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def count(self, link_ids: Optional[List[str]] = None, since: Optional[str] = None) -> int: ...
+
+    @abstractmethod
+    async def delete_for_links(self, link_ids: List[str]): ...
+
+    @abstractmethod
+    async def add_bot_hits(self, hits: Dict[tuple, Dict[str, int]]): ...
+
+    @abstractmethod
+    async def count_bot_hits(self, link_id: str) -> int: ...
+
+    @abstractmethod
+    async def count_bot_hits_by_link(self, link_ids: List[str]) -> Dict[str, int]: ...
+
+    @abstractmethod
+    async def group_for_links(self, link_ids: List[str], since: Optional[str] = None, until: Optional[str] = None) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_link_ids_before(self, cutoff: str) -> List[str]: ...
+
+    @abstractmethod
+    async def list_before(self, link_id: str, cutoff: str, limit: int) -> List[dict]: ...
+
+    @abstractmethod
+    async def delete_ids(self, click_ids: List[str]): ...
+
+    @abstractmethod
+    async def upsert_rollups(self, rollups: List[dict]): ...
+
+    @abstractmethod
+    async def list_rollups(self, link_id: str, since_day: Optional[str] = None, until_day: Optional[str] = None) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_rollups_for_links(self, link_ids: List[str], since_day: Optional[str] = None, until_day: Optional[str] = None) -> List[dict]: ...
+
+    @abstractmethod
+    async def count_rollups(self, link_ids: Optional[List[str]] = None) -> int: ...
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, database):
+        self.col = database.users
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.col.find_one({"id": user_id}, {"_id": 0})
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self.col.find_one({"username": username}, {"_id": 0})
+
+    async def exists(self, username: str, email: str) -> bool:
+        return await self.col.find_one({"$or": [{"username": username}, {"email": email}]}, {"_id": 1}) is not None
+
+    async def insert(self, user: dict):
+        # Copy so Motor does not add _id to the caller's dict
+        await self.col.insert_one(user.copy())
+
+    async def list(self, limit: int = 1000) -> List[dict]:
+        return await self.col.find({}, {"_id": 0, "password_hash": 0}).to_list(limit)
+
+    async def update(self, user_id: str, fields: dict):
+        await self.col.update_one({"id": user_id}, {"$set": fields})
+
+    async def delete(self, user_id: str):
+        await self.col.delete_one({"id": user_id})
+
+    async def count(self) -> int:
+        return await self.col.count_documents({})
+
+# Link search: the short code matches by prefix, every other token must
+# appear in the title or the URL. Trigrams back the substring lookups.
+# Only the start of each field is indexed, a 2 KB tracking URL would otherwise
+# add ~2000 index keys; links cut short always reach the regex check instead.
+SEARCH_GRAM_CHARS = int(os.environ.get('SEARCH_GRAM_CHARS', '256'))
+
+def search_tokens(text: str) -> List[str]:
+    return text.lower().split()
+
+def trigrams(text: Optional[str]) -> Set[str]:
+    text = (text or "").lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def link_search_fields(link: dict) -> dict:
+    texts = [link.get("title") or "", link.get("original_url") or ""]
+    grams = set().union(*(trigrams(text[:SEARCH_GRAM_CHARS]) for text in texts))
+    return {"search_grams": sorted(grams), "search_partial": any(len(text) > SEARCH_GRAM_CHARS for text in texts)}
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    # Scheme and host are case-insensitive and default ports are implied,
+    # path, query and fragment are kept as given
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    if parts.username or parts.password:
+        netloc = f"{parts.netloc.rsplit('@', 1)[0]}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+def url_hash(url: str) -> str:
+    # 128 bits of the normalized destination, a fixed-size dedup key
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()[:32]
+
+class MongoLinkRepository(LinkRepository):
+    # The search fields are index-only, never handed out
+    projection = {"_id": 0, "search_grams": 0, "search_partial": 0}
+
+    def __init__(self, database):
+        self.col = database.links
+
+    async def get(self, link_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        query = {"id": link_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return await self.col.find_one(query, self.projection)
+
+    async def get_many(self, link_ids: List[str], user_id: str) -> List[dict]:
+        return await self.col.find({"id": {"$in": link_ids}, "user_id": user_id}, self.projection).to_list(None)
+
+    async def get_by_short_code(self, short_code: str) -> Optional[dict]:
+        return await self.col.find_one({"short_code": short_code}, self.projection)
+
+    async def short_code_exists(self, short_code: str) -> bool:
+        return await self.col.find_one({"short_code": short_code}, {"_id": 1}) is not None
+
+    async def find_reusable(self, user_id: str, url_hash: str) -> Optional[dict]:
+        # Only plain, live links are handed out again
+        query = {
+            "user_id": user_id,
+            "url_hash": url_hash,
+            "is_active": {"$ne": False},
+            "password_hash": None,
+            "$or": [{"expires_at": None}, {"expires_at": {"$gte": datetime.now(timezone.utc).isoformat()}}]
+        }
+        return await self.col.find_one(query, self.projection, sort=[("created_at", -1)])
+
+    async def insert(self, link: dict):
+        await self.col.insert_one({**link, **link_search_fields(link)})
+
+    async def list_by_user(self, user_id: str, limit: int = 1000) -> List[dict]:
+        return await self.col.find({"user_id": user_id}, self.projection).sort("created_at", -1).to_list(limit)
+
+    async def list_keys_by_user(self, user_id: str) -> List[dict]:
+        return await self.col.find({"user_id": user_id}, {"_id": 0, "id": 1, "short_code": 1}).to_list(None)
+
+    async def search(
+        self,
+        user_id: str,
+        text: Optional[str] = None,
+        active: Optional[bool] = None,
+        expired: Optional[bool] = None,
+        protected: Optional[bool] = None,
+        after: Optional[list] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        conditions = [{"user_id": user_id}]
+        if text:
+            # The gram lookup narrows candidates through the index, the regexes make it exact
+            token_matches, grams = [], set()
+            for token in search_tokens(text):
+                pattern = {"$regex": re.escape(token), "$options": "i"}
+                token_matches.append({"$or": [{"title": pattern}, {"original_url": pattern}]})
+                grams |= trigrams(token)
+            if grams:
+                token_matches.insert(0, {"$or": [{"search_grams": {"$all": sorted(grams)}}, {"search_partial": True}]})
+            conditions.append({"$or": [{"short_code": {"$regex": f"^{re.escape(text)}"}}, {"$and": token_matches}]})
+        if active is not None:
+            conditions.append({"is_active": {"$ne": False}} if active else {"is_active": False})
+        if expired is not None:
+            now = datetime.now(timezone.utc).isoformat()
+            if expired:
+                conditions.append({"expires_at": {"$ne": None, "$lt": now}})
+            else:
+                conditions.append({"$or": [{"expires_at": None}, {"expires_at": {"$gte": now}}]})
+        if protected is not None:
+            conditions.append({"password_hash": {"$ne": None}} if protected else {"password_hash": None})
+        if after is not None:
+            created_at, link_id = after
+            conditions.append({"$or": [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "id": {"$lt": link_id}}]})
+        cursor = self.col.find({"$and": conditions}, self.projection).sort([("created_at", -1), ("id", -1)])
+        return await cursor.to_list(limit)
+
+    async def update(self, link_id: str, fields: dict):
+        update = {"$set": fields}
+        if "title" in fields or "original_url" in fields:
+            current = await self.col.find_one({"id": link_id}, {"_id": 0, "title": 1, "original_url": 1}) or {}
+            update["$set"] = {**fields, **link_search_fields({**current, **fields})}
+        await self.col.update_one({"id": link_id}, update)
+
+    async def backfill_derived_fields(self, batch_size: int = 1000):
+        # Links stored before search, destination dedup or capped grams existed
+        query = {"$or": [{"search_partial": {"$exists": False}}, {"url_hash": {"$exists": False}}]}
+        cursor = self.col.find(query, {"_id": 0, "id": 1, "title": 1, "original_url": 1})
+        operations = []
+        async for link in cursor:
+            fields = {**link_search_fields(link), "url_hash": url_hash(link["original_url"])}
+            operations.append(UpdateOne({"id": link["id"]}, {"$set": fields}))
+            if len(operations) >= batch_size:
+                await self.col.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await self.col.bulk_write(operations, ordered=False)
+
+    async def increment_clicks(self, link_id: str, amount: int = 1):
+        await self.col.update_one({"id": link_id}, {"$inc": {"click_count": amount}})
+
+    async def add_duplicate_hits(self, hits: Dict[str, int]):
+        operations = [UpdateOne({"id": link_id}, {"$inc": {"duplicate_hits": count}}) for link_id, count in hits.items()]
+        await self.col.bulk_write(operations, ordered=False)
+
+    async def increment_clicks_bulk(self, counts: Dict[str, int]):
+        if counts:
+            operations = [UpdateOne({"id": link_id}, {"$inc": {"click_count": count}}) for link_id, count in counts.items()]
+            await self.col.bulk_write(operations, ordered=False)
+
+    async def list_page(self, after_id: Optional[str] = None, limit: int = 1000) -> List[dict]:
+        query = {"id": {"$gt": after_id}} if after_id is not None else {}
+        return await self.col.find(query, self.projection).sort("id", 1).to_list(limit)
+
+    async def delete(self, link_id: str, user_id: str) -> bool:
+        result = await self.col.delete_one({"id": link_id, "user_id": user_id})
+        return result.deleted_count > 0
+
+    async def delete_by_user(self, user_id: str):
+        await self.col.delete_many({"user_id": user_id})
+
+    async def count(self, user_id: Optional[str] = None, created_since: Optional[str] = None) -> int:
+        query = {}
+        if user_id is not None:
+            query["user_id"] = user_id
+        if created_since is not None:
+            query["created_at"] = {"$gte": created_since}
+        return await self.col.count_documents(query)
+
+# Click pages leave out the raw user agent and the link id the caller already has
+CLICK_PAGE_FIELDS = ("id", "timestamp", "ip_address", "device_type", "browser", "os", "country", "city", "referrer")
+CLICK_FILTER_FIELDS = ("device_type", "browser", "os", "country", "referrer")
+CLICK_GROUP_FIELDS = ("link_id",) + CLICK_FILTER_FIELDS
+
+class MongoClickRepository(ClickRepository):
+    def __init__(self, database):
+        self.col = database.clicks
+        self.bot_hits = database.bot_hits
+        self.rollups = database.click_rollups
+
+    async def insert(self, click: dict):
+        await self.col.insert_one(click.copy())
+
+    async def insert_missing(self, clicks: List[dict]) -> Dict[str, int]:
+        # Upsert on the click id, so a replayed click is only stored once
+        operations = [
+            UpdateOne({"id": click["id"]}, {"$setOnInsert": {k: v for k, v in click.items() if k != "id"}}, upsert=True)
+            for click in clicks
+        ]
+        result = await self.col.bulk_write(operations, ordered=False)
+        counts = {}
+        for index in result.upserted_ids:
+            link_id = clicks[index]["link_id"]
+            counts[link_id] = counts.get(link_id, 0) + 1
+        return counts
+
+    async def list_for_link(self, link_id: str, limit: Optional[int] = 10000, since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        query = {"link_id": link_id}
+        if since is not None or until is not None:
+            query["timestamp"] = {}
+            if since is not None:
+                query["timestamp"]["$gte"] = since
+            if until is not None:
+                query["timestamp"]["$lt"] = until
+        return await self.col.find(query, {"_id": 0}).sort("timestamp", -1).to_list(limit)
+
+    async def page(
+        self,
+        link_id: str,
+        filters: Dict[str, Optional[str]],
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        before: Optional[list] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        # None matches clicks where the field was never recorded
+        query = {"link_id": link_id, **filters}
+        if since is not None or until is not None:
+            query["timestamp"] = {}
+            if since is not None:
+                query["timestamp"]["$gte"] = since
+            if until is not None:
+                query["timestamp"]["$lt"] = until
+        if before is not None:
+            timestamp, click_id = before
+            query["$or"] = [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "id": {"$lt": click_id}}]
+        projection = {"_id": 0, **{field: 1 for field in CLICK_PAGE_FIELDS}}
+        return await self.col.find(query, projection).sort([("timestamp", -1), ("id", -1)]).to_list(limit)
+
+    async def count(self, link_ids: Optional[List[str]] = None, since: Optional[str] = None) -> int:
+        query = {}
+        if link_ids is not None:
+            query["link_id"] = {"$in": link_ids}
+        if since is not None:
+            query["timestamp"] = {"$gte": since}
+        return await self.col.count_documents(query)
+
+    async def delete_for_links(self, link_ids: List[str]):
+        await self.col.delete_many({"link_id": {"$in": link_ids}})
+        await self.rollups.delete_many({"link_id": {"$in": link_ids}})
+
+    async def add_bot_hits(self, hits: Dict[tuple, Dict[str, int]]):
+        operations = []
+        for (link_id, day), reasons in hits.items():
+            inc = {f"reasons.{reason}": count for reason, count in reasons.items()}
+            inc["count"] = sum(reasons.values())
+            operations.append(UpdateOne({"link_id": link_id, "day": day}, {"$inc": inc}, upsert=True))
+        await self.bot_hits.bulk_write(operations, ordered=False)
+
+    async def count_bot_hits(self, link_id: str) -> int:
+        days = await self.bot_hits.find({"link_id": link_id}, {"_id": 0, "count": 1}).to_list(None)
+        return sum(day.get("count", 0) for day in days)
+
+    async def count_bot_hits_by_link(self, link_ids: List[str]) -> Dict[str, int]:
+        pipeline = [
+            {"$match": {"link_id": {"$in": link_ids}}},
+            {"$group": {"_id": "$link_id", "count": {"$sum": "$count"}}}
+        ]
+        return {row["_id"]: row["count"] for row in await self.bot_hits.aggregate(pipeline).to_list(None)}
+
+    async def group_for_links(self, link_ids: List[str], since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        # One row per link, day and dimension combination, counted server side
+        match = {"link_id": {"$in": link_ids}}
+        if since is not None or until is not None:
+            match["timestamp"] = {}
+            if since is not None:
+                match["timestamp"]["$gte"] = since
+            if until is not None:
+                match["timestamp"]["$lt"] = until
+        key = {field: f"${field}" for field in CLICK_GROUP_FIELDS}
+        key["day"] = {"$substr": ["$timestamp", 0, 10]}
+        pipeline = [{"$match": match}, {"$group": {"_id": key, "clicks": {"$sum": 1}}}]
+        rows = await self.col.aggregate(pipeline).to_list(None)
+        return [{**row["_id"], "clicks": row["clicks"]} for row in rows]
+
+    async def list_link_ids_before(self, cutoff: str) -> List[str]:
+        return await self.col.distinct("link_id", {"timestamp": {"$lt": cutoff}})
+
+    async def list_before(self, link_id: str, cutoff: str, limit: int) -> List[dict]:
+        query = {"link_id": link_id, "timestamp": {"$lt": cutoff}}
+        return await self.col.find(query, {"_id": 0}).sort([("timestamp", 1), ("id", 1)]).to_list(limit)
+
+    async def delete_ids(self, click_ids: List[str]):
+        await self.col.delete_many({"id": {"$in": click_ids}})
+
+    async def upsert_rollups(self, rollups: List[dict]):
+        operations = [
+            ReplaceOne({"link_id": r["link_id"], "day": r["day"], "segment": r["segment"]}, r, upsert=True)
+            for r in rollups
+        ]
+        if operations:
+            await self.rollups.bulk_write(operations, ordered=False)
+
+    async def list_rollups(self, link_id: str, since_day: Optional[str] = None, until_day: Optional[str] = None) -> List[dict]:
+        query = {"link_id": link_id}
+        if since_day is not None or until_day is not None:
+            query["day"] = {}
+            if since_day is not None:
+                query["day"]["$gte"] = since_day
+            if until_day is not None:
+                query["day"]["$lte"] = until_day
+        return await self.rollups.find(query, {"_id": 0}).to_list(None)
+
+    async def list_rollups_for_links(self, link_ids: List[str], since_day: Optional[str] = None, until_day: Optional[str] = None) -> List[dict]:
+        query = {"link_id": {"$in": link_ids}}
+        if since_day is not None or until_day is not None:
+            query["day"] = {}
+            if since_day is not None:
+                query["day"]["$gte"] = since_day
+            if until_day is not None:
+                query["day"]["$lte"] = until_day
+        return await self.rollups.find(query, {"_id": 0}).to_list(None)
+
+    async def count_rollups(self, link_ids: Optional[List[str]] = None) -> int:
+        pipeline = []
+        if link_ids is not None:
+            pipeline.append({"$match": {"link_id": {"$in": link_ids}}})
+        pipeline.append({"$group": {"_id": None, "total": {"$sum": "$total"}}})
+        result = await self.rollups.aggregate(pipeline).to_list(1)
+        return result[0]["total"] if result else 0
+
+class MongoStorage:
+    def __init__(self, database):
+        self.database = database
+        self.users = MongoUserRepository(database)
+        self.links = MongoLinkRepository(database)
+        self.clicks = MongoClickRepository(database)
+
+    async def start(self):
+        # Not unique, so startup never fails on legacy duplicates
+        await self.database.users.create_index("id")
+        await self.database.users.create_index("username")
+        await self.database.links.create_index("id")
+        await self.database.links.create_index("short_code")
+        await self.database.links.create_index([("user_id", 1), ("created_at", -1)])
+        await self.database.links.create_index([("user_id", 1), ("search_grams", 1)])
+        await self.database.links.create_index([("user_id", 1), ("search_partial", 1)])
+        await self.database.links.create_index([("user_id", 1), ("url_hash", 1)])
+        await self.migrate("link_derived_fields_v2", self.links.backfill_derived_fields)
+        await self.database.clicks.create_index([("link_id", 1), ("timestamp", -1), ("id", -1)])
+        await self.database.clicks.create_index("timestamp")
+        await self.database.clicks.create_index("id")
+        await self.database.bot_hits.create_index([("link_id", 1), ("day", 1)])
+        await self.database.click_rollups.create_index([("link_id", 1), ("day", 1), ("segment", 1)])
+
+    async def migrate(self, name: str, migration):
+        # Recorded once done, so later boots skip the collection scan. Workers
+        # booting together may both run it, migrations must be idempotent.
+        if await self.database.migrations.find_one({"_id": name}):
+            return
+        await migration()
+        await self.database.migrations.update_one(
+            {"_id": name}, {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}}, upsert=True
+        )
+
+    async def ping(self):
+        await self.database.command("ping")
+
+    async def close(self):
+        pass
+
+SQLITE_SCHEMA = {
+    "users": {
+        "id": "TEXT PRIMARY KEY",
+        "username": "TEXT NOT NULL",
+        "email": "TEXT",
+        "password_hash": "TEXT",
+        "is_admin": "INTEGER",
+        "is_active": "INTEGER",
+        "created_at": "TEXT"
+    },
+    "links": {
+        "id": "TEXT PRIMARY KEY",
+        "user_id": "TEXT NOT NULL",
+        "original_url": "TEXT NOT NULL",
+        "short_code": "TEXT NOT NULL",
+        "title": "TEXT",
+        "password_hash": "TEXT",
+        "password_version": "INTEGER DEFAULT 0",
+        "expires_at": "TEXT",
+        "is_active": "INTEGER",
+        "click_count": "INTEGER DEFAULT 0",
+        "duplicate_hits": "INTEGER DEFAULT 0",
+        "created_at": "TEXT",
+        "qr_code": "TEXT",
+        "url_hash": "TEXT"
+    },
+    "clicks": {
+        "id": "TEXT PRIMARY KEY",
+        "link_id": "TEXT NOT NULL",
+        "timestamp": "TEXT",
+        "ip_address": "TEXT",
+        "user_agent": "TEXT",
+        "device_type": "TEXT",
+        "browser": "TEXT",
+        "os": "TEXT",
+        "country": "TEXT",
+        "city": "TEXT",
+        "referrer": "TEXT"
+    },
+    "bot_hits": {
+        "link_id": "TEXT NOT NULL",
+        "day": "TEXT NOT NULL",
+        "count": "INTEGER DEFAULT 0",
+        "reasons": "TEXT"
+    },
+    "click_rollups": {
+        "link_id": "TEXT NOT NULL",
+        "day": "TEXT NOT NULL",
+        "segment": "TEXT NOT NULL",
+        "total": "INTEGER DEFAULT 0",
+        "dimensions": "TEXT"
+    }
+}
+SQLITE_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users(username)",
+    "CREATE INDEX IF NOT EXISTS users_email ON users(email)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS links_short_code ON links(short_code)",
+    "CREATE INDEX IF NOT EXISTS links_user_created ON links(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS links_created ON links(created_at)",
+    "CREATE INDEX IF NOT EXISTS links_user_url_hash ON links(user_id, url_hash)",
+    "DROP INDEX IF EXISTS clicks_link_time",
+    "CREATE INDEX IF NOT EXISTS clicks_link_time_id ON clicks(link_id, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS clicks_time ON clicks(timestamp)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS bot_hits_link_day ON bot_hits(link_id, day)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS click_rollups_key ON click_rollups(link_id, day, segment)"
+]
+SQLITE_BOOL_COLUMNS = {"is_admin", "is_active"}
+# Trigram full-text index over link titles and URLs, kept in sync by triggers.
+# Click count updates do not touch the indexed columns and skip it.
+SQLITE_SEARCH_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS links_search USING fts5("
+    "title, original_url, content='links', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS links_search_insert AFTER INSERT ON links BEGIN "
+    "INSERT INTO links_search(rowid, title, original_url) VALUES (new.rowid, new.title, new.original_url); END",
+    "CREATE TRIGGER IF NOT EXISTS links_search_delete AFTER DELETE ON links BEGIN "
+    "INSERT INTO links_search(links_search, rowid, title, original_url) VALUES ('delete', old.rowid, old.title, old.original_url); END",
+    "CREATE TRIGGER IF NOT EXISTS links_search_update AFTER UPDATE OF title, original_url ON links BEGIN "
+    "INSERT INTO links_search(links_search, rowid, title, original_url) VALUES ('delete', old.rowid, old.title, old.original_url); "
+    "INSERT INTO links_search(rowid, title, original_url) VALUES (new.rowid, new.title, new.original_url); END"
+]
+
+@contextmanager
+def sqlite_transaction(conn: sqlite3.Connection):
+    # Connections run in autocommit mode (isolation_level=None), where
+    # "with conn:" never opens a transaction
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+class SQLiteDatabase:
+    # A single connection driven by one worker thread, so the event loop never
+    # blocks on disk and writes are serialized without extra locking
+    def __init__(self, path: str):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.conn = None
+        self.fts = False
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        for table, columns in SQLITE_SCHEMA.items():
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(f'{name} {kind}' for name, kind in columns.items())})")
+            # Columns added after the table was first created
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, kind in columns.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind.replace('PRIMARY KEY', '')}")
+        for statement in SQLITE_INDEXES:
+            conn.execute(statement)
+        self.fts = self._open_search(conn)
+        # Links stored before destination dedup existed
+        legacy = conn.execute("SELECT id, original_url FROM links WHERE url_hash IS NULL").fetchall()
+        if legacy:
+            with sqlite_transaction(conn):
+                conn.executemany("UPDATE links SET url_hash = ? WHERE id = ?", [(url_hash(row["original_url"]), row["id"]) for row in legacy])
+        self.conn = conn
+
+    @staticmethod
+    def _open_search(conn: sqlite3.Connection) -> bool:
+        # Needs FTS5 with the trigram tokenizer (SQLite 3.34+), search falls back to LIKE scans
+        try:
+            for statement in SQLITE_SEARCH_SCHEMA:
+                conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite trigram araması kullanılamıyor, tarama yapılacak: {e}")
+            return False
+        # The index maps link rowids, which VACUUM may renumber
+        try:
+            conn.execute("INSERT INTO links_search(links_search, rank) VALUES ('integrity-check', 1)")
+        except sqlite3.DatabaseError:
+            conn.execute("INSERT INTO links_search(links_search) VALUES ('rebuild')")
+        return True
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        return {key: bool(row[key]) if key in SQLITE_BOOL_COLUMNS and row[key] is not None else row[key] for key in row.keys()}
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        return self.conn.execute(sql, params).rowcount
+
+    def _executemany(self, sql: str, rows: list):
+        with sqlite_transaction(self.conn):
+            self.conn.executemany(sql, rows)
+
+    def _fetchall(self, sql: str, params: tuple) -> List[dict]:
+        return [self._to_dict(row) for row in self.conn.execute(sql, params)]
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def start(self):
+        await self.run(self._open)
+
+    async def close(self):
+        if self.conn is not None:
+            await self.run(self.conn.close)
+        self.executor.shutdown(wait=False)
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        return await self.run(self._execute, sql, params)
+
+    async def executemany(self, sql: str, rows: list):
+        await self.run(self._executemany, sql, rows)
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> List[dict]:
+        return await self.run(self._fetchall, sql, params)
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> Optional[dict]:
+        rows = await self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+    async def scalar(self, sql: str, params: tuple = ()):
+        row = await self.run(lambda: self.conn.execute(sql, params).fetchone())
+        return row[0] if row else None
+
+    async def insert(self, table: str, doc: dict):
+        columns = [name for name in doc if name in SQLITE_SCHEMA[table]]
+        placeholders = ", ".join("?" for _ in columns)
+        await self.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", tuple(doc[name] for name in columns))
+
+    async def update(self, table: str, key: str, value, fields: dict):
+        columns = [name for name in fields if name in SQLITE_SCHEMA[table]]
+        if not columns:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        await self.execute(f"UPDATE {table} SET {assignments} WHERE {key} = ?", tuple(fields[name] for name in columns) + (value,))
+
+def sql_in(values: List[str]) -> str:
+    return ", ".join("?" for _ in values)
+
+class SQLiteUserRepository(UserRepository):
+    def __init__(self, database: SQLiteDatabase):
+        self.db = database
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.db.fetchone("SELECT * FROM users WHERE id = ?", (user_id,))
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self.db.fetchone("SELECT * FROM users WHERE username = ?", (username,))
+
+    async def exists(self, username: str, email: str) -> bool:
+        return await self.db.scalar("SELECT 1 FROM users WHERE username = ? OR email = ? LIMIT 1", (username, email)) is not None
+
+    async def insert(self, user: dict):
+        await self.db.insert("users", user)
+
+    async def list(self, limit: int = 1000) -> List[dict]:
+        users = await self.db.fetchall("SELECT * FROM users LIMIT ?", (limit,))
+        for user in users:
+            user.pop("password_hash", None)
+        return users
+
+    async def update(self, user_id: str, fields: dict):
+        await self.db.update("users", "id", user_id, fields)
+
+    async def delete(self, user_id: str):
+        await self.db.execute("DELETE FROM users WHERE id = ?", (user_id,))
+
+    async def count(self) -> int:
+        return await self.db.scalar("SELECT COUNT(*) FROM users")
+
+class SQLiteLinkRepository(LinkRepository):
+    def __init__(self, database: SQLiteDatabase):
+        self.db = database
+
+    async def get(self, link_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        if user_id is None:
+            return await self.db.fetchone("SELECT * FROM links WHERE id = ?", (link_id,))
+        return await self.db.fetchone("SELECT * FROM links WHERE id = ? AND user_id = ?", (link_id, user_id))
+
+    async def get_many(self, link_ids: List[str], user_id: str) -> List[dict]:
+        return await self.db.fetchall(f"SELECT * FROM links WHERE user_id = ? AND id IN ({sql_in(link_ids)})", (user_id, *link_ids))
+
+    async def get_by_short_code(self, short_code: str) -> Optional[dict]:
+        return await self.db.fetchone("SELECT * FROM links WHERE short_code = ?", (short_code,))
+
+    async def short_code_exists(self, short_code: str) -> bool:
+        return await self.db.scalar("SELECT 1 FROM links WHERE short_code = ?", (short_code,)) is not None
+
+    async def find_reusable(self, user_id: str, url_hash: str) -> Optional[dict]:
+        return await self.db.fetchone(
+            "SELECT * FROM links WHERE user_id = ? AND url_hash = ? AND COALESCE(is_active, 1) = 1 "
+            "AND password_hash IS NULL AND (expires_at IS NULL OR expires_at >= ?) ORDER BY created_at DESC LIMIT 1",
+            (user_id, url_hash, datetime.now(timezone.utc).isoformat())
+        )
+
+    async def insert(self, link: dict):
+        await self.db.insert("links", link)
+
+    async def list_by_user(self, user_id: str, limit: int = 1000) -> List[dict]:
+        return await self.db.fetchall("SELECT * FROM links WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (user_id, limit))
+
+    async def list_keys_by_user(self, user_id: str) -> List[dict]:
+        return await self.db.fetchall("SELECT id, short_code FROM links WHERE user_id = ?", (user_id,))
+
+    async def search(
+        self,
+        user_id: str,
+        text: Optional[str] = None,
+        active: Optional[bool] = None,
+        expired: Optional[bool] = None,
+        protected: Optional[bool] = None,
+        after: Optional[list] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        conditions, params = ["user_id = ?"], [user_id]
+        if text:
+            token_conditions, token_params, phrases = [], [], []
+            for token in search_tokens(text):
+                # Trigram matching needs three characters, shorter tokens use LIKE
+                if self.db.fts and len(token) >= 3:
+                    phrases.append('"' + token.replace('"', '""') + '"')
+                else:
+                    pattern = "%" + token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    token_conditions.append("(title LIKE ? ESCAPE '\\' OR original_url LIKE ? ESCAPE '\\')")
+                    token_params.extend([pattern, pattern])
+            if phrases:
+                token_conditions.insert(0, "rowid IN (SELECT rowid FROM links_search WHERE links_search MATCH ?)")
+                token_params.insert(0, " AND ".join(phrases))
+            # Prefix as a range so the short code index applies
+            conditions.append(f"((short_code >= ? AND short_code < ?) OR ({' AND '.join(token_conditions)}))")
+            params.extend([text, text + "\U0010ffff", *token_params])
+        if active is not None:
+            conditions.append("COALESCE(is_active, 1) = 1" if active else "is_active = 0")
+        if expired is not None:
+            conditions.append("expires_at IS NOT NULL AND expires_at < ?" if expired else "(expires_at IS NULL OR expires_at >= ?)")
+            params.append(datetime.now(timezone.utc).isoformat())
+        if protected is not None:
+            conditions.append("password_hash IS NOT NULL" if protected else "password_hash IS NULL")
+        if after is not None:
+            created_at, link_id = after
+            conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([created_at, created_at, link_id])
+        params.append(limit)
+        return await self.db.fetchall(
+            f"SELECT * FROM links WHERE {' AND '.join(conditions)} ORDER BY created_at DESC, id DESC LIMIT ?",
+            tuple(params)
+        )
+
+    async def update(self, link_id: str, fields: dict):
+        await self.db.update("links", "id", link_id, fields)
+
+    async def increment_clicks(self, link_id: str, amount: int = 1):
+        await self.db.execute("UPDATE links SET click_count = COALESCE(click_count, 0) + ? WHERE id = ?", (amount, link_id))
+
+    async def add_duplicate_hits(self, hits: Dict[str, int]):
+        await self.db.executemany(
+            "UPDATE links SET duplicate_hits = COALESCE(duplicate_hits, 0) + ? WHERE id = ?",
+            [(count, link_id) for link_id, count in hits.items()]
+        )
+
+    async def increment_clicks_bulk(self, counts: Dict[str, int]):
+        await self.db.executemany(
+            "UPDATE links SET click_count = COALESCE(click_count, 0) + ? WHERE id = ?",
+            [(count, link_id) for link_id, count in counts.items()]
+        )
+
+    async def list_page(self, after_id: Optional[str] = None, limit: int = 1000) -> List[dict]:
+        return await self.db.fetchall("SELECT * FROM links WHERE id > ? ORDER BY id LIMIT ?", (after_id or "", limit))
+
+    async def delete(self, link_id: str, user_id: str) -> bool:
+        return await self.db.execute("DELETE FROM links WHERE id = ? AND user_id = ?", (link_id, user_id)) > 0
+
+    async def delete_by_user(self, user_id: str):
+        await self.db.execute("DELETE FROM links WHERE user_id = ?", (user_id,))
+
+    async def count(self, user_id: Optional[str] = None, created_since: Optional[str] = None) -> int:
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if created_since is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_since)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return await self.db.scalar(f"SELECT COUNT(*) FROM links{where}", tuple(params))
+
+class SQLiteClickRepository(ClickRepository):
+    def __init__(self, database: SQLiteDatabase):
+        self.db = database
+
+    async def insert(self, click: dict):
+        await self.db.insert("clicks", click)
+
+    def _insert_missing(self, clicks: List[dict]) -> Dict[str, int]:
+        counts = {}
+        with sqlite_transaction(self.db.conn):
+            for click in clicks:
+                columns = [name for name in click if name in SQLITE_SCHEMA["clicks"]]
+                cursor = self.db.conn.execute(
+                    f"INSERT OR IGNORE INTO clicks ({', '.join(columns)}) VALUES ({sql_in(columns)})",
+                    tuple(click[name] for name in columns)
+                )
+                if cursor.rowcount:
+                    counts[click["link_id"]] = counts.get(click["link_id"], 0) + 1
+        return counts
+
+    async def insert_missing(self, clicks: List[dict]) -> Dict[str, int]:
+        return await self.db.run(self._insert_missing, clicks)
+
+    async def list_for_link(self, link_id: str, limit: Optional[int] = 10000, since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        conditions, params = ["link_id = ?"], [link_id]
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        # SQLite treats a negative LIMIT as no limit
+        params.append(limit if limit is not None else -1)
+        return await self.db.fetchall(f"SELECT * FROM clicks WHERE {' AND '.join(conditions)} ORDER BY timestamp DESC LIMIT ?", tuple(params))
+
+    async def page(
+        self,
+        link_id: str,
+        filters: Dict[str, Optional[str]],
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        before: Optional[list] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        conditions, params = ["link_id = ?"], [link_id]
+        for field, value in filters.items():
+            if value is None:
+                conditions.append(f"{field} IS NULL")
+            else:
+                conditions.append(f"{field} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        if before is not None:
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend(before)
+        params.append(limit)
+        return await self.db.fetchall(
+            f"SELECT {', '.join(CLICK_PAGE_FIELDS)} FROM clicks WHERE {' AND '.join(conditions)} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            tuple(params)
+        )
+
+    async def count(self, link_ids: Optional[List[str]] = None, since: Optional[str] = None) -> int:
+        conditions, params = [], []
+        if link_ids is not None:
+            conditions.append(f"link_id IN ({sql_in(link_ids)})")
+            params.extend(link_ids)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return await self.db.scalar(f"SELECT COUNT(*) FROM clicks{where}", tuple(params))
+
+    async def delete_for_links(self, link_ids: List[str]):
+        await self.db.execute(f"DELETE FROM clicks WHERE link_id IN ({sql_in(link_ids)})", tuple(link_ids))
+        await self.db.execute(f"DELETE FROM click_rollups WHERE link_id IN ({sql_in(link_ids)})", tuple(link_ids))
+
+    def _add_bot_hits(self, hits: Dict[tuple, Dict[str, int]]):
+        # Reason counters are merged in Python inside one transaction, the rows are tiny
+        conn = self.db.conn
+        with sqlite_transaction(conn):
+            for (link_id, day), new_reasons in hits.items():
+                row = conn.execute("SELECT reasons FROM bot_hits WHERE link_id = ? AND day = ?", (link_id, day)).fetchone()
+                reasons = json.loads(row["reasons"]) if row and row["reasons"] else {}
+                for reason, count in new_reasons.items():
+                    reasons[reason] = reasons.get(reason, 0) + count
+                conn.execute(
+                    "INSERT INTO bot_hits (link_id, day, count, reasons) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(link_id, day) DO UPDATE SET count = excluded.count, reasons = excluded.reasons",
+                    (link_id, day, sum(reasons.values()), json.dumps(reasons))
+                )
+
+    async def add_bot_hits(self, hits: Dict[tuple, Dict[str, int]]):
+        await self.db.run(self._add_bot_hits, hits)
+
+    async def count_bot_hits(self, link_id: str) -> int:
+        return await self.db.scalar("SELECT COALESCE(SUM(count), 0) FROM bot_hits WHERE link_id = ?", (link_id,))
+
+    async def count_bot_hits_by_link(self, link_ids: List[str]) -> Dict[str, int]:
+        rows = await self.db.fetchall(
+            f"SELECT link_id, SUM(count) AS count FROM bot_hits WHERE link_id IN ({sql_in(link_ids)}) GROUP BY link_id",
+            tuple(link_ids)
+        )
+        return {row["link_id"]: row["count"] for row in rows}
+
+    async def group_for_links(self, link_ids: List[str], since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        conditions, params = [f"link_id IN ({sql_in(link_ids)})"], list(link_ids)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        columns = ", ".join(CLICK_GROUP_FIELDS)
+        return await self.db.fetchall(
+            f"SELECT {columns}, substr(timestamp, 1, 10) AS day, COUNT(*) AS clicks FROM clicks "
+            f"WHERE {' AND '.join(conditions)} GROUP BY {columns}, day",
+            tuple(params)
+        )
+
+    async def list_link_ids_before(self, cutoff: str) -> List[str]:
+        rows = await self.db.fetchall("SELECT DISTINCT link_id FROM clicks WHERE timestamp < ?", (cutoff,))
+        return [row["link_id"] for row in rows]
+
+    async def list_before(self, link_id: str, cutoff: str, limit: int) -> List[dict]:
+        return await self.db.fetchall(
+            "SELECT * FROM clicks WHERE link_id = ? AND timestamp < ? ORDER BY timestamp, id LIMIT ?",
+            (link_id, cutoff, limit)
+        )
+
+    async def delete_ids(self, click_ids: List[str]):
+        await self.db.execute(f"DELETE FROM clicks WHERE id IN ({sql_in(click_ids)})", tuple(click_ids))
+
+    async def upsert_rollups(self, rollups: List[dict]):
+        rows = []
+        for rollup in rollups:
+            dimensions = {key: rollup[key] for key in ROLLUP_DIMENSIONS}
+            rows.append((rollup["link_id"], rollup["day"], rollup["segment"], rollup["total"], json.dumps(dimensions)))
+        await self.db.executemany(
+            "INSERT INTO click_rollups (link_id, day, segment, total, dimensions) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(link_id, day, segment) DO UPDATE SET total = excluded.total, dimensions = excluded.dimensions",
+            rows
+        )
+
+    async def list_rollups(self, link_id: str, since_day: Optional[str] = None, until_day: Optional[str] = None) -> List[dict]:
+        conditions, params = ["link_id = ?"], [link_id]
+        if since_day is not None:
+            conditions.append("day >= ?")
+            params.append(since_day)
+        if until_day is not None:
+            conditions.append("day <= ?")
+            params.append(until_day)
+        rows = await self.db.fetchall(f"SELECT * FROM click_rollups WHERE {' AND '.join(conditions)}", tuple(params))
+        for row in rows:
+            row.update(json.loads(row.pop("dimensions") or "{}"))
+        return rows
+
+    async def list_rollups_for_links(self, link_ids: List[str], since_day: Optional[str] = None, until_day: Optional[str] = None) -> List[dict]:
+        conditions, params = [f"link_id IN ({sql_in(link_ids)})"], list(link_ids)
+        if since_day is not None:
+            conditions.append("day >= ?")
+            params.append(since_day)
+        if until_day is not None:
+            conditions.append("day <= ?")
+            params.append(until_day)
+        rows = await self.db.fetchall(f"SELECT * FROM click_rollups WHERE {' AND '.join(conditions)}", tuple(params))
+        for row in rows:
+            row.update(json.loads(row.pop("dimensions") or "{}"))
+        return rows
+
+    async def count_rollups(self, link_ids: Optional[List[str]] = None) -> int:
+        if link_ids is None:
+            return await self.db.scalar("SELECT COALESCE(SUM(total), 0) FROM click_rollups")
+        return await self.db.scalar(f"SELECT COALESCE(SUM(total), 0) FROM click_rollups WHERE link_id IN ({sql_in(link_ids)})", tuple(link_ids))
+
+class SQLiteStorage:
+    def __init__(self, path: str):
+        self.database = SQLiteDatabase(path)
+        self.users = SQLiteUserRepository(self.database)
+        self.links = SQLiteLinkRepository(self.database)
+        self.clicks = SQLiteClickRepository(self.database)
+
+    async def start(self):
+        await self.database.start()
+
+    async def ping(self):
+        await self.database.scalar("SELECT 1")
+
+    async def close(self):
+        await self.database.close()
+
+def create_storage():
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(SQLITE_PATH)
+    return MongoStorage(db)
+
+storage = create_storage()
+
+# ==================== HELPERS ====================
+
+def generate_short_code(length: int = 6) -> str:
+    chars = string.ascii_letters + string.digits
+    return ''.join(random.choices(chars, k=length))
+
+def hash_password(password: str) -> str:
+    with phase("bcrypt"):
+        return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    with phase("bcrypt"):
+        return pwd_context.verify(plain_password, hashed_password)
+
+# bcrypt runs in threads so a hash never stalls the event loop, bounded so a
+# burst of them cannot take over the default thread pool
+BCRYPT_CONCURRENCY = int(os.environ.get('BCRYPT_CONCURRENCY', '2'))
+bcrypt_slots = asyncio.Semaphore(BCRYPT_CONCURRENCY)
+
+async def hash_password_async(password: str) -> str:
+    async with bcrypt_slots:
+        return await asyncio.to_thread(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    async with bcrypt_slots:
+        return await asyncio.to_thread(verify_password, plain_password, hashed_password)
+
+def create_access_token(data: dict) -> str:
+    to_encode = data.copy()
+    expire = datetime.now(timezone.utc) + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def create_stream_token(user_id: str, link_id: str) -> str:
+    expire = datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    return jwt.encode({"sub": user_id, "scope": "stream", "link_id": link_id, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+def unlock_signature(link: dict, version: int, expires: int) -> str:
+    # Bound to the link id and the current password hash, so a token outlives
+    # neither a deleted link whose slug is taken again nor a password change
+    fingerprint = hashlib.sha256((link.get("password_hash") or "").encode()).hexdigest()[:16]
+    message = f"{link['id']}|{link['short_code']}|{version}|{fingerprint}|{expires}".encode()
+    return hmac.new(UNLOCK_KEY, message, hashlib.sha256).hexdigest()[:32]
+
+def issue_unlock_token(link: dict) -> str:
+    version = link.get("password_version") or 0
+    expires = int(time.time()) + UNLOCK_TOKEN_EXPIRE_SECONDS
+    return f"{version}.{expires}.{unlock_signature(link, version, expires)}"
+
+def check_unlock_token(link: dict, token: Optional[str]) -> bool:
+    if not token:
+        return False
+    try:
+        version, expires, signature = token.split(".")
+        version, expires = int(version), int(expires)
+    except ValueError:
+        return False
+    if version != (link.get("password_version") or 0) or expires < time.time():
+        return False
+    return hmac.compare_digest(signature, unlock_signature(link, version, expires))
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Yetkilendirme gerekli")
+    
+    token = authorization.replace("Bearer ", "")
+    try:
+        with phase("auth"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id = payload.get("sub")
+            # Scoped tokens (stream) never act as a session
+            if not user_id or payload.get("scope"):
+                raise HTTPException(status_code=401, detail="Geçersiz token")
+            
+            user = await get_user_by_id(user_id)
+        if not user:
+            raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı")
+        return user
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token süresi dolmuş")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Geçersiz token")
+
+async def get_stream_user(link_id: str, token: Optional[str] = None, authorization: Optional[str] = Header(None)) -> dict:
+    # Header auth as usual, otherwise a stream token issued for this link
+    if authorization or not token:
+        return await get_current_user(authorization)
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token süresi dolmuş")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Geçersiz token")
+    if payload.get("scope") != "stream" or payload.get("link_id") != link_id or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Geçersiz token")
+    user = await get_user_by_id(payload["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı")
+    return user
+
+# Real traffic repeats a small set of user agents, parsing is regex heavy
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def parse_user_agent(ua_string: str) -> dict:
+    try:
+        ua = parse(ua_string)
+        device_type = "mobile" if ua.is_mobile else ("tablet" if ua.is_tablet else "desktop")
+        return {
+            "device_type": device_type,
+            "browser": ua.browser.family or "unknown",
+            "os": ua.os.family or "unknown",
+            "is_bot": ua.is_bot
+        }
+    except:
+        return {"device_type": "unknown", "browser": "unknown", "os": "unknown", "is_bot": False}
+
+# Click ids keep the UUID shape: a random per-process prefix plus a counter,
+# so no urandom call per click. Forked workers draw a fresh prefix.
+def reset_click_ids():
+    global click_id_prefix, click_id_counter
+    prefix = uuid.uuid4().hex[:20]
+    click_id_prefix = f"{prefix[:8]}-{prefix[8:12]}-{prefix[12:16]}-{prefix[16:20]}-"
+    click_id_counter = itertools.count()
+
+def next_click_id() -> str:
+    return f"{click_id_prefix}{next(click_id_counter):012x}"
+
+reset_click_ids()
+os.register_at_fork(after_in_child=reset_click_ids)
+
+def public_link(link: dict) -> dict:
+    # Never expose the password hash, only whether one is set
+    link = dict(link)
+    link["has_password"] = bool(link.pop("password_hash", None))
+    link.pop("url_hash", None)
+    return link
+
+def encode_cursor(*values) -> str:
+    # Opaque keyset position for paginated listings
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise HTTPException(status_code=400, detail="Geçersiz sayfa imleci")
+    return values
+
+def serialize_datetime(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return obj
+
+def click_day(timestamp) -> Optional[str]:
+    if not timestamp:
+        return None
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return timestamp.strftime("%Y-%m-%d")
+
+def click_dimensions(click: dict) -> dict:
+    # Same keys and fallbacks as the analytics breakdowns
+    return {
+        "devices": click.get("device_type", "unknown"),
+        "browsers": click.get("browser", "unknown"),
+        "os_stats": click.get("os", "unknown"),
+        "countries": click.get("country", "Bilinmiyor"),
+        "referrers": click.get("referrer", "Doğrudan")
+    }
+
+async def record_click(link: dict, request: Request) -> Optional[dict]:
+    ua_string = request.headers.get("user-agent", "")
+    
+    # Cheap checks first so known crawlers never reach the UA parser
+    with phase("bot_filter"):
+        reason = bot_filter.classify(request, ua_string)
+    if reason is None:
+        with phase("ua_parse"):
+            ua_info = parse_user_agent(ua_string)
+        if ua_info["is_bot"] and bot_filter.enabled:
+            reason = "ua_parser"
+    if reason is not None:
+        bot_filter.record(link["id"], reason)
+        return None
+    
+    ip_address = client_ip(request)
+    if click_deduper.seen(link["id"], ip_address, ua_string):
+        return None
+    bot_filter.stats["persisted"] += 1
+
+    # Same shape as ClickEvent, built directly since this runs on every redirect
+    click_dict = {
+        "id": next_click_id(),
+        "link_id": link["id"],
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "ip_address": ip_address,
+        "user_agent": ua_string,
+        "device_type": ua_info["device_type"],
+        "browser": ua_info["browser"],
+        "os": ua_info["os"],
+        "country": None,
+        "city": None,
+        "referrer": request.headers.get("referer")
+    }
+    try:
+        await guarded(storage.clicks.insert, click_dict)
+    except DatabaseUnavailable:
+        # Journaled locally and replayed once the database is back
+        click_spool.append(click_dict)
+    else:
+        # Increment click count, owed through the journal if this one fails
+        try:
+            await guarded(storage.links.increment_clicks, link["id"])
+        except DatabaseUnavailable:
+            click_spool.append_increment(link["id"])
+
+    await publish_click(link["id"], click_dict)
+    return click_dict
+
+# ==================== CHANNELS ====================
+
+# Worker-to-worker message transports. Each one delivers a message to every
+# other worker; the sender applies its own messages locally.
+
+class NullChannel:
+    # Single worker, nothing to fan out to
+    async def start(self, handler):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def send(self, message: dict):
+        pass
+
+class UnixSocketChannel:
+    # Single-host fan-out: every worker binds a datagram socket in a shared
+    # directory and senders write to each peer socket found there
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = None
+        self.sock = None
+        self.handler = None
+
+    async def start(self, handler):
+        self.handler = handler
+        # Any local user able to write here could inject messages
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        info = os.stat(self.directory)
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"{self.directory} başka bir kullanıcıya ait")
+        if info.st_mode & 0o077:
+            os.chmod(self.directory, 0o700)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._on_readable)
+
+    async def stop(self):
+        if self.sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                self.handler(json.loads(data))
+            except Exception as e:
+                logger.warning(f"Kanal mesajı işlenemedi: {e}")
+
+    async def send(self, message: dict):
+        data = json.dumps(message).encode()
+        for name in os.listdir(self.directory):
+            peer = os.path.join(self.directory, name)
+            if peer == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self.sock.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a worker that died
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                logger.warning(f"Kanal dolu, mesaj atlandı: {peer}")
+
+class MongoCappedChannel:
+    # Multi-host fan-out through a capped collection that every worker tails.
+    # Works on a standalone mongod, unlike change streams.
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.task = None
+
+    async def start(self, handler):
+        try:
+            await db.create_collection(self.name, capped=True, size=self.size)
+        except CollectionInvalid:
+            pass
+        self.task = asyncio.create_task(self._tail(handler))
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def send(self, message: dict):
+        await db[self.name].insert_one({"origin": WORKER_ID, "message": message})
+
+    async def _tail(self, handler):
+        collection = db[self.name]
+        last = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id else {}
+                cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                async for doc in cursor:
+                    last_id = doc["_id"]
+                    if doc.get("origin") != WORKER_ID:
+                        handler(doc["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.name} akışı koptu: {e}")
+            # A tailable cursor dies on an empty collection, retry shortly
+            await asyncio.sleep(1)
+
+# ==================== CACHES ====================
+
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '30'))
+CACHE_MAX_ITEMS = int(os.environ.get('CACHE_MAX_ITEMS', '10000'))
+INVALIDATION_TRANSPORT = os.environ.get('INVALIDATION_TRANSPORT', 'unix')
+INVALIDATION_SOCKET_DIR = os.environ.get('INVALIDATION_SOCKET_DIR', '/tmp/besturl-invalidation')
+
+class EntityCache:
+    # TTL cache with versioned invalidation. The TTL bounds staleness even
+    # if an invalidation message is lost. Versions are wall-clock ns so they
+    # compare across workers.
+    def __init__(self, ttl: float, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.invalidated: Dict[str, int] = {}
+
+    @staticmethod
+    def version() -> int:
+        return time.time_ns()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self.entries[key]
+            return None
+        return entry[0]
+
+    def put(self, key: str, value: dict, version: int):
+        # A load that started before the last invalidation may carry stale data
+        if self.invalidated.get(key, 0) >= version:
+            return
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_items:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key: str, version: int):
+        self.entries.pop(key, None)
+        if version > self.invalidated.get(key, 0):
+            self.invalidated[key] = version
+        # Tombstones only matter for loads in flight, so drop old ones
+        if len(self.invalidated) > self.max_items:
+            cutoff = self.version() - int(self.ttl * 1e9)
+            self.invalidated = {k: v for k, v in self.invalidated.items() if v > cutoff}
+
+class InvalidationBus:
+    # Also carries runtime settings ("config" messages) so an admin change
+    # reaches every worker. Only a setting newer than the last one applied is used.
+    def __init__(self, channel):
+        self.channel = channel
+        self.caches: Dict[str, list] = {}
+        self.configurables: Dict[str, list] = {}
+        self.config_versions: Dict[str, int] = {}
+        self.config_lock = asyncio.Lock()
+
+    def register(self, kind: str, cache):
+        # Anything with invalidate(key, version): entity caches, the link snapshot
+        self.caches.setdefault(kind, []).append(cache)
+
+    def register_config(self, name: str, target):
+        # Anything with an async configure(settings)
+        self.configurables.setdefault(name, []).append(target)
+
+    async def start(self):
+        try:
+            await self.channel.start(self.apply)
+        except OSError as e:
+            # Caches still expire by TTL, only cross-worker delivery is lost
+            logger.warning(f"Önbellek geçersizleme kanalı açılamadı: {e}")
+            self.channel = NullChannel()
+
+    async def stop(self):
+        await self.channel.stop()
+
+    def apply(self, message: dict):
+        if message.get("type") == "config":
+            if self.accept_config(message):
+                asyncio.get_running_loop().create_task(self.configure(message))
+            return
+        for cache in self.caches.get(message["kind"], []):
+            cache.invalidate(message["key"], message["version"])
+
+    def accept_config(self, message: dict) -> bool:
+        # Messages can arrive out of order across transports
+        if message["version"] <= self.config_versions.get(message["name"], 0):
+            return False
+        self.config_versions[message["name"]] = message["version"]
+        return True
+
+    async def configure(self, message: dict):
+        async with self.config_lock:
+            # A newer setting was accepted while this one waited
+            if message["version"] != self.config_versions.get(message["name"]):
+                return
+            for target in self.configurables.get(message["name"], []):
+                try:
+                    await target.configure(message["settings"])
+                except Exception as e:
+                    logger.warning(f"{message['name']} ayarı uygulanamadı: {e}")
+
+    async def publish(self, kind: str, key: str):
+        message = {"kind": kind, "key": key, "version": EntityCache.version()}
+        self.apply(message)
+        try:
+            await self.channel.send(message)
+        except Exception as e:
+            logger.warning(f"Önbellek geçersizleme yayınlanamadı: {e}")
+
+    async def publish_config(self, name: str, settings: dict):
+        # Applied here first so the caller sees it, then sent to the other workers
+        message = {"type": "config", "name": name, "settings": settings, "version": EntityCache.version()}
+        if self.accept_config(message):
+            await self.configure(message)
+        try:
+            await self.channel.send(message)
+        except Exception as e:
+            logger.warning(f"{name} ayarı yayınlanamadı: {e}")
+
+def create_invalidation_channel():
+    if INVALIDATION_TRANSPORT == "mongo":
+        return MongoCappedChannel("invalidations", 4 * 1024 * 1024)
+    if INVALIDATION_TRANSPORT == "unix":
+        return UnixSocketChannel(INVALIDATION_SOCKET_DIR)
+    return NullChannel()
+
+# Links are cached by short code for the redirect path, users by id for auth
+link_cache = EntityCache(CACHE_TTL_SECONDS, CACHE_MAX_ITEMS)
+user_cache = EntityCache(CACHE_TTL_SECONDS, CACHE_MAX_ITEMS)
+invalidation_bus = InvalidationBus(create_invalidation_channel())
+invalidation_bus.register("link", link_cache)
+invalidation_bus.register("user", user_cache)
+
+async def get_link_by_short_code(short_code: str) -> Optional[dict]:
+    # Cached dicts are shared, callers must not mutate them
+    link = link_cache.get(short_code)
+    if link is not None:
+        return link
+    version = EntityCache.version()
+    link = await guarded(storage.links.get_by_short_code, short_code)
+    if link is not None:
+        link_cache.put(short_code, link, version)
+        link_snapshot.put(link)
+    return link
+
+async def get_user_by_id(user_id: str) -> Optional[dict]:
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    version = EntityCache.version()
+    user = await storage.users.get(user_id)
+    if user is not None:
+        user_cache.put(user_id, user, version)
+    return user
+
+# ==================== DEGRADED MODE ====================
+
+# When the database is slow or down, redirects are served from a local
+# snapshot of link data and clicks go to a local journal, which is replayed
+# in bulk once the database answers again
+SPOOL_ENABLED = os.environ.get('SPOOL_ENABLED', 'true').lower() == 'true'
+SPOOL_DIR = Path(os.environ.get('SPOOL_DIR', str(ROOT_DIR / 'click_spool')))
+SPOOL_DB_TIMEOUT_SECONDS = float(os.environ.get('SPOOL_DB_TIMEOUT_SECONDS', '1.5'))
+SPOOL_RETRY_SECONDS = float(os.environ.get('SPOOL_RETRY_SECONDS', '5'))
+SPOOL_FSYNC_MS = float(os.environ.get('SPOOL_FSYNC_MS', '50'))
+SPOOL_SEGMENT_BYTES = int(os.environ.get('SPOOL_SEGMENT_BYTES', str(4 * 1024 * 1024)))
+SPOOL_SEGMENT_SECONDS = float(os.environ.get('SPOOL_SEGMENT_SECONDS', '60'))
+SPOOL_REPLAY_SECONDS = float(os.environ.get('SPOOL_REPLAY_SECONDS', '5'))
+SPOOL_REPLAY_BATCH = int(os.environ.get('SPOOL_REPLAY_BATCH', '1000'))
+SPOOL_REPLAY_STALE_SECONDS = float(os.environ.get('SPOOL_REPLAY_STALE_SECONDS', '300'))
+SPOOL_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get('SPOOL_SNAPSHOT_REFRESH_SECONDS', '3600'))
+SNAPSHOT_FIELDS = ("id", "user_id", "short_code", "original_url", "password_hash", "password_version", "expires_at", "is_active")
+
+class DatabaseUnavailable(Exception):
+    pass
+
+class DatabaseHealth:
+    # A failed or slow call trips degraded mode. For SPOOL_RETRY_SECONDS calls
+    # skip the database entirely, then the next call or replay probe retries.
+    def __init__(self):
+        self.degraded_since = None
+        self.retry_at = 0.0
+        self.last_error = None
+        self.trips = 0
+
+    @property
+    def degraded(self) -> bool:
+        return self.degraded_since is not None
+
+    @property
+    def bypass(self) -> bool:
+        return self.degraded_since is not None and time.monotonic() < self.retry_at
+
+    def trip(self, error: Exception):
+        self.retry_at = time.monotonic() + SPOOL_RETRY_SECONDS
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.degraded_since is None:
+            self.degraded_since = datetime.now(timezone.utc).isoformat()
+            self.trips += 1
+            logger.warning(f"Veritabanına erişilemiyor, yedek moda geçildi: {self.last_error}")
+
+    def recover(self):
+        if self.degraded_since is not None:
+            self.degraded_since = None
+            logger.info("Veritabanı erişimi geri geldi, yedek moddan çıkıldı")
+
+    async def probe(self) -> bool:
+        try:
+            await asyncio.wait_for(storage.ping(), SPOOL_DB_TIMEOUT_SECONDS)
+        except Exception as e:
+            self.trip(e)
+            return False
+        self.recover()
+        return True
+
+db_health = DatabaseHealth()
+
+async def guarded(fn, *args):
+    # Storage calls on the redirect path get a deadline instead of hanging
+    if not SPOOL_ENABLED:
+        return await fn(*args)
+    if db_health.bypass:
+        raise DatabaseUnavailable(db_health.last_error)
+    try:
+        result = await asyncio.wait_for(fn(*args), SPOOL_DB_TIMEOUT_SECONDS)
+    except (asyncio.TimeoutError, PyMongoError, sqlite3.Error, OSError) as e:
+        db_health.trip(e)
+        raise DatabaseUnavailable(str(e)) from e
+    db_health.recover()
+    return result
+
+class LinkSnapshot:
+    # Last known redirect fields per short code in a local SQLite file shared
+    # by the workers. Filled as links are read and by a periodic full copy.
+    def __init__(self, path: Path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+        self.conn = None
+        self.pending: Dict[str, Optional[dict]] = {}
+        self.stats = {"served": 0, "refreshed": 0, "last_refresh_at": None}
+        self.task = None
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("CREATE TABLE IF NOT EXISTS links (short_code TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn = conn
+
+    def _write(self, pending: Dict[str, Optional[dict]]):
+        with sqlite_transaction(self.conn):
+            self.conn.executemany(
+                "INSERT INTO links (short_code, data) VALUES (?, ?) ON CONFLICT(short_code) DO UPDATE SET data = excluded.data",
+                [(code, json.dumps(link)) for code, link in pending.items() if link is not None]
+            )
+            self.conn.executemany("DELETE FROM links WHERE short_code = ?", [(code,) for code, link in pending.items() if link is None])
+
+    def _read(self, short_code: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT data FROM links WHERE short_code = ?", (short_code,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def put(self, link: dict):
+        if self.conn is not None:
+            self.pending[link["short_code"]] = {field: link.get(field) for field in SNAPSHOT_FIELDS}
+
+    def invalidate(self, short_code: str, version: int):
+        if self.conn is not None:
+            self.pending[short_code] = None
+
+    async def get(self, short_code: str) -> Optional[dict]:
+        if self.conn is None:
+            return None
+        if short_code in self.pending:
+            link = self.pending[short_code]
+        else:
+            link = await self.run(self._read, short_code)
+        if link is not None:
+            self.stats["served"] += 1
+        return link
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        await self.run(self._write, pending)
+
+    async def count(self) -> int:
+        if self.conn is None:
+            return 0
+        return await self.run(lambda: self.conn.execute("SELECT COUNT(*) FROM links").fetchone()[0])
+
+    async def refresh(self):
+        # Full copy, paged by id so it never holds the whole collection
+        after_id = None
+        while True:
+            links = await storage.links.list_page(after_id, 1000)
+            for link in links:
+                self.put(link)
+            await self.flush()
+            self.stats["refreshed"] += len(links)
+            if len(links) < 1000:
+                break
+            after_id = links[-1]["id"]
+        self.stats["last_refresh_at"] = datetime.now(timezone.utc).isoformat()
+
+    async def loop(self):
+        # None so the first full copy runs right after startup
+        last_refresh = None
+        while True:
+            try:
+                if not db_health.degraded and (last_refresh is None or time.monotonic() - last_refresh >= SPOOL_SNAPSHOT_REFRESH_SECONDS):
+                    last_refresh = time.monotonic()
+                    await self.refresh()
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Link anlık görüntüsü güncellenemedi: {e}")
+            await asyncio.sleep(1)
+
+    async def start(self):
+        await self.run(self._open)
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.conn is not None:
+            await self.flush()
+            await self.run(self.conn.close)
+            self.conn = None
+
+class ClickSpool:
+    # Append-only JSON lines journal. Each worker writes its own segment,
+    # "<opened ms>-<worker>.open", holding an exclusive flock on it. Full or
+    # old segments are sealed to ".jsonl", any worker may replay a sealed
+    # segment after claiming it by renaming it to ".replaying".
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+        self.buffer: List[str] = []
+        self.segment = None
+        self.segment_path = None
+        self.segment_bytes = 0
+        self.segment_opened = 0.0
+        self.stats = {"spooled": 0, "replayed": 0, "already_stored": 0, "segments_replayed": 0, "torn_lines": 0, "increments_spooled": 0, "increments_replayed": 0, "last_replay_at": None}
+        self.tasks = []
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def append(self, click: dict):
+        self.buffer.append(json.dumps(click, default=str))
+        self.stats["spooled"] += 1
+
+    def append_increment(self, link_id: str):
+        # The click itself is stored, only its click_count increment is owed
+        self.buffer.append(json.dumps({"increment": link_id}))
+        self.stats["increments_spooled"] += 1
+
+    def _open_segment(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_path = self.directory / f"{int(time.time() * 1000):013d}-{WORKER_ID[:8]}.open"
+        self.segment = open(self.segment_path, "ab")
+        fcntl.flock(self.segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.segment_bytes = 0
+        self.segment_opened = time.monotonic()
+
+    def _seal(self):
+        if self.segment is None:
+            return
+        # Renamed while the lock is still held, so no one else seals it too
+        os.replace(self.segment_path, self.segment_path.with_suffix(".jsonl"))
+        self.segment.close()
+        self.segment = None
+
+    def _write(self, lines: List[str]):
+        if self.segment is None:
+            self._open_segment()
+        data = ("\n".join(lines) + "\n").encode()
+        self.segment.write(data)
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        self.segment_bytes += len(data)
+        if self.segment_bytes >= SPOOL_SEGMENT_BYTES:
+            self._seal()
+
+    def _rotate(self, force: bool = False):
+        if self.segment is None:
+            return
+        if force or time.monotonic() - self.segment_opened >= SPOOL_SEGMENT_SECONDS:
+            self._seal()
+
+    async def flush(self, seal: bool = False):
+        lines, self.buffer = self.buffer, []
+        if lines:
+            await self.run(self._write, lines)
+        await self.run(self._rotate, seal)
+
+    def _adopt_orphans(self):
+        if not self.directory.is_dir():
+            return
+        # An unlockable .open segment belongs to a live worker
+        for path in self.directory.glob("*.open"):
+            if path == self.segment_path:
+                continue
+            try:
+                with open(path, "ab") as f:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.replace(path, path.with_suffix(".jsonl"))
+            except (BlockingIOError, FileNotFoundError):
+                continue
+        # A claim that outlived its replay belongs to a worker that died mid-way
+        for path in self.directory.glob("*.replaying"):
+            try:
+                if time.time() - path.stat().st_mtime > SPOOL_REPLAY_STALE_SECONDS:
+                    os.replace(path, path.with_suffix(".jsonl"))
+            except FileNotFoundError:
+                continue
+
+    def _sealed(self) -> List[Path]:
+        return sorted(self.directory.glob("*.jsonl")) if self.directory.is_dir() else []
+
+    def _claim(self) -> Optional[Path]:
+        for path in self._sealed():
+            claimed = path.with_suffix(".replaying")
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            return claimed
+        return None
+
+    def _load(self, path: Path) -> List[dict]:
+        clicks = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    clicks.append(json.loads(line))
+                except ValueError:
+                    # A crash can leave one half-written line at the end
+                    self.stats["torn_lines"] += 1
+        return clicks
+
+    async def replay(self) -> int:
+        await self.run(self._adopt_orphans)
+        if not self.buffer and self.segment is None and not await self.run(self._sealed):
+            return 0
+        if not await db_health.probe():
+            return 0
+        # Seal our own segment so recent clicks go back without waiting for rotation
+        await self.flush(seal=True)
+        
+        replayed = 0
+        while True:
+            pending = await self.run(self._claim)
+            if pending is None:
+                break
+            try:
+                clicks = await self.run(self._load, pending)
+                for start in range(0, len(clicks), SPOOL_REPLAY_BATCH):
+                    batch = clicks[start:start + SPOOL_REPLAY_BATCH]
+                    increments = [entry["increment"] for entry in batch if "increment" in entry]
+                    batch = [entry for entry in batch if "increment" not in entry]
+                    counts = await storage.clicks.insert_missing(batch) if batch else {}
+                    inserted = sum(counts.values())
+                    for link_id in increments:
+                        counts[link_id] = counts.get(link_id, 0) + 1
+                    await storage.links.increment_clicks_bulk(counts)
+                    self.stats["replayed"] += inserted
+                    self.stats["already_stored"] += len(batch) - inserted
+                    self.stats["increments_replayed"] += len(increments)
+                    replayed += inserted
+            except Exception as e:
+                # Put it back, the upserts make a second pass harmless
+                await self.run(os.replace, pending, pending.with_suffix(".jsonl"))
+                db_health.trip(e)
+                logger.warning(f"Tıklama günlüğü aktarılamadı: {e}")
+                break
+            await self.run(pending.unlink)
+            self.stats["segments_replayed"] += 1
+        
+        self.stats["last_replay_at"] = datetime.now(timezone.utc).isoformat()
+        if replayed:
+            logger.info(f"Günlükten {replayed} tıklama aktarıldı")
+        return replayed
+
+    def _depth(self) -> dict:
+        segments, clicks, size, oldest = 0, 0, 0, None
+        if self.directory.is_dir():
+            for path in self.directory.iterdir():
+                if path.suffix not in (".open", ".jsonl", ".replaying"):
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue
+                segments += 1
+                size += len(data)
+                clicks += data.count(b"\n")
+                opened = int(path.name.split("-", 1)[0]) / 1000
+                oldest = opened if oldest is None else min(oldest, opened)
+        return {
+            "segments": segments,
+            "bytes": size,
+            "clicks": clicks + len(self.buffer),
+            # Age of the oldest click still waiting for the database
+            "replay_lag_seconds": round(time.time() - oldest, 1) if oldest is not None else 0.0
+        }
+
+    async def metrics(self) -> dict:
+        return {**await self.run(self._depth), **self.stats}
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(SPOOL_FSYNC_MS / 1000)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Tıklama günlüğü yazılamadı: {e}")
+
+    async def replay_loop(self):
+        while True:
+            await asyncio.sleep(SPOOL_REPLAY_SECONDS)
+            try:
+                await self.replay()
+            except Exception as e:
+                logger.warning(f"Tıklama günlüğü aktarımı başarısız: {e}")
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(self.flush_loop()), asyncio.create_task(self.replay_loop())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        # Sealed on the way out so any worker can replay it
+        await self.flush(seal=True)
+
+link_snapshot = LinkSnapshot(SPOOL_DIR / "links.db")
+click_spool = ClickSpool(SPOOL_DIR)
+invalidation_bus.register("link", link_snapshot)
+
+# ==================== LIVE EVENTS ====================
+
+LIVE_BROKER = os.environ.get('LIVE_BROKER', 'local')
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', '256'))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', '15'))
+LIVE_CAPPED_BYTES = int(os.environ.get('LIVE_CAPPED_BYTES', str(16 * 1024 * 1024)))
+# Workers with a live dashboard open re-announce the link this often, the
+# others stop publishing for it once announcements are missed
+LIVE_WATCH_SECONDS = float(os.environ.get('LIVE_WATCH_SECONDS', '30'))
+WORKER_ID = uuid.uuid4().hex
+
+class LiveHub:
+    # In-process pub/sub, one bounded queue per subscriber
+    def __init__(self, queue_size: int = LIVE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, link_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(link_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, link_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(link_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[link_id]
+
+    def has_subscribers(self, link_id: str) -> bool:
+        return link_id in self.subscribers
+
+    def dispatch(self, link_id: str, event: dict):
+        for queue in list(self.subscribers.get(link_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop it rather than buffer without bound.
+                # The backlog is discarded so the None sentinel fits.
+                self.unsubscribe(link_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+class LocalLiveBroker:
+    # Single-worker stand-in, events never leave this process
+    def __init__(self, hub: LiveHub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def wants(self, link_id: str) -> bool:
+        return self.hub.has_subscribers(link_id)
+
+    async def watch(self, link_id: str):
+        pass
+
+    async def publish(self, link_id: str, event: dict):
+        self.hub.dispatch(link_id, event)
+
+class MongoLiveBroker(LocalLiveBroker):
+    # Cross-worker fan-out over the live_events capped collection. Workers
+    # announce the links they have subscribers for on the same collection,
+    # so clicks are only published for links someone is watching.
+    def __init__(self, hub: LiveHub):
+        super().__init__(hub)
+        self.channel = MongoCappedChannel("live_events", LIVE_CAPPED_BYTES)
+        # link id -> monotonic time the last announcement runs out
+        self.watched: Dict[str, float] = {}
+        self.task = None
+
+    async def start(self):
+        await self.channel.start(self.receive)
+        self.task = asyncio.create_task(self.announce())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.channel.stop()
+
+    def receive(self, message: dict):
+        if "watch" in message:
+            self.watched[message["watch"]] = time.monotonic() + LIVE_WATCH_SECONDS * 2.5
+        else:
+            self.hub.dispatch(message["link_id"], message["event"])
+
+    def wants(self, link_id: str) -> bool:
+        if self.hub.has_subscribers(link_id):
+            return True
+        expires = self.watched.get(link_id)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self.watched[link_id]
+            return False
+        return True
+
+    async def watch(self, link_id: str):
+        await self.channel.send({"watch": link_id})
+
+    async def announce(self):
+        while True:
+            await asyncio.sleep(LIVE_WATCH_SECONDS)
+            try:
+                for link_id in list(self.hub.subscribers):
+                    await self.watch(link_id)
+            except Exception as e:
+                logger.warning(f"Canlı izleme duyurulamadı: {e}")
+
+    async def publish(self, link_id: str, event: dict):
+        self.hub.dispatch(link_id, event)
+        await self.channel.send({"link_id": link_id, "event": event})
+
+live_hub = LiveHub()
+live_broker = MongoLiveBroker(live_hub) if LIVE_BROKER == "mongo" else LocalLiveBroker(live_hub)
+
+def build_live_event(click: dict) -> dict:
+    delta = {"total_clicks": 1}
+    for key, value in click_dimensions(click).items():
+        delta[key] = {value: 1}
+    day = click_day(click.get("timestamp"))
+    if day:
+        delta["daily_clicks"] = {day: 1}
+    return {
+        "click": {k: click.get(k) for k in ("id", "timestamp", "device_type", "browser", "os", "country", "city", "referrer")},
+        "delta": delta
+    }
+
+async def publish_click(link_id: str, click: dict):
+    if not live_broker.wants(link_id):
+        return
+    try:
+        await live_broker.publish(link_id, build_live_event(click))
+    except Exception as e:
+        # Live updates are best effort, never fail the redirect
+        logger.warning(f"Canlı olay yayınlanamadı: {e}")
+
+def sse_format(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# ==================== BOT FILTER ====================
+
+BOT_RULES_FILE = os.environ.get('BOT_RULES_FILE', str(ROOT_DIR / 'bot_rules.json'))
+BOT_FLUSH_SECONDS = float(os.environ.get('BOT_FLUSH_SECONDS', '10'))
+
+DEFAULT_BOT_RULES = {
+    # "count" keeps an aggregated counter, "skip" drops the hit, "off" persists everything
+    "mode": "count",
+    "head_is_bot": True,
+    "empty_ua_is_bot": False,
+    "prefetch_headers": ["purpose", "sec-purpose", "x-purpose", "x-moz"],
+    # Preview crawler identifiers only. Bare app names such as LinkedIn,
+    # Pinterest or Telegram also appear in their in-app browsers, which are
+    # real visitors; the crawlers themselves are caught by "bot".
+    "signatures": [
+        "bot", "crawl", "spider", "slurp", "facebookexternalhit", "facebookcatalog",
+        "whatsapp/", "slack-imgproxy", "skypeuripreview", "embedly",
+        "vkshare", "bitlybot", "outbrain",
+        "quora link preview", "google-pagerenderer", "googleother", "headlesschrome",
+        "uptimerobot", "pingdom", "statuscake", "site24x7", "betteruptime", "uptime-kuma",
+        "curl/", "wget/", "python-requests", "python-urllib", "aiohttp", "httpx",
+        "go-http-client", "java/", "okhttp", "axios/", "node-fetch", "libwww-perl", "scrapy"
+    ]
+}
+
+class BotFilter:
+    # Classifies non-human hits so they can skip full click persistence
+    def __init__(self, rules_file: str):
+        self.rules_file = rules_file
+        self.pending: Dict[tuple, Dict[str, int]] = {}
+        self.stats = {"persisted": 0, "filtered": 0}
+        self.task = None
+        self.reload()
+
+    def load(self) -> dict:
+        rules = dict(DEFAULT_BOT_RULES)
+        path = Path(self.rules_file)
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                rules.update(json.load(f))
+        if rules["mode"] not in ("count", "skip", "off"):
+            raise ValueError(f"Geçersiz bot filtre modu: {rules['mode']}")
+        return rules
+
+    def reload(self) -> dict:
+        rules = self.load()
+        self.use(rules)
+        return rules
+
+    async def configure(self, settings: dict):
+        # Rules broadcast by the worker that handled the reload
+        self.use(settings["rules"])
+
+    def use(self, rules: dict):
+        # One alternation is much cheaper than looping over the signatures
+        pattern = "|".join(re.escape(sig.lower()) for sig in rules["signatures"])
+        self.pattern = re.compile(pattern) if pattern else None
+        self.prefetch_headers = [h.lower() for h in rules["prefetch_headers"]]
+        self.rules = rules
+
+    @property
+    def enabled(self) -> bool:
+        return self.rules["mode"] != "off"
+
+    def classify(self, request: Request, ua_string: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if request.method == "HEAD" and self.rules["head_is_bot"]:
+            return "head"
+        for header in self.prefetch_headers:
+            value = request.headers.get(header)
+            if value and ("prefetch" in value.lower() or "preview" in value.lower()):
+                return "prefetch"
+        if not ua_string:
+            return "empty_ua" if self.rules["empty_ua_is_bot"] else None
+        if self.pattern is not None and self.pattern.search(ua_string.lower()):
+            return "signature"
+        return None
+
+    def record(self, link_id: str, reason: str):
+        self.stats["filtered"] += 1
+        if self.rules["mode"] != "count":
+            return
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        reasons = self.pending.setdefault((link_id, day), {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        try:
+            await storage.clicks.add_bot_hits(pending)
+        except Exception:
+            # Keep the counts for the next flush
+            for key, reasons in pending.items():
+                merged = self.pending.setdefault(key, {})
+                for reason, count in reasons.items():
+                    merged[reason] = merged.get(reason, 0) + count
+            raise
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(BOT_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Bot sayaçları yazılamadı: {e}")
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
+
+bot_filter = BotFilter(BOT_RULES_FILE)
+invalidation_bus.register_config("bot_filter", bot_filter)
+
+# ==================== CLICK DEDUP ====================
+
+# Repeated hits from the same visitor within the window (double clicks,
+# retries, prefetch-then-visit) are counted, not stored as click events
+CLICK_DEDUP_SECONDS = float(os.environ.get('CLICK_DEDUP_SECONDS', '10'))
+CLICK_DEDUP_MAX_KEYS = int(os.environ.get('CLICK_DEDUP_MAX_KEYS', '200000'))
+CLICK_DEDUP_FLUSH_SECONDS = float(os.environ.get('CLICK_DEDUP_FLUSH_SECONDS', '10'))
+
+class ClickDeduper:
+    # Two rotating generations of visitor fingerprints. A hit found in either
+    # is a duplicate, so the effective window is between one and two windows.
+    # A full generation rotates early: memory stays bounded and the window
+    # only shrinks under floods.
+    def __init__(self, window: float, max_keys: int):
+        self.window = window
+        self.max_keys = max_keys
+        self.current: Set[int] = set()
+        self.previous: Set[int] = set()
+        self.rotated_at = time.monotonic()
+        self.pending: Dict[str, int] = {}
+        self.stats = {"unique": 0, "duplicates": 0, "rotations": 0}
+        self.task = None
+
+    def seen(self, link_id: str, ip: Optional[str], ua_string: str) -> bool:
+        if self.window <= 0:
+            return False
+        now = time.monotonic()
+        if now - self.rotated_at >= self.window or len(self.current) >= self.max_keys:
+            # After two idle windows the current generation is stale as well
+            self.previous = self.current if now - self.rotated_at < 2 * self.window else set()
+            self.current = set()
+            self.rotated_at = now
+            self.stats["rotations"] += 1
+        
+        # 64-bit fingerprint, the sets never hold the strings themselves
+        key = hash((link_id, ip, ua_string))
+        if key in self.current or key in self.previous:
+            self.stats["duplicates"] += 1
+            self.pending[link_id] = self.pending.get(link_id, 0) + 1
+            return True
+        self.current.add(key)
+        self.stats["unique"] += 1
+        return False
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        try:
+            await storage.links.add_duplicate_hits(pending)
+        except Exception:
+            # Keep the counts for the next flush
+            for link_id, count in pending.items():
+                self.pending[link_id] = self.pending.get(link_id, 0) + count
+            raise
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(CLICK_DEDUP_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Tekrar tıklama sayaçları yazılamadı: {e}")
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
+
+click_deduper = ClickDeduper(CLICK_DEDUP_SECONDS, CLICK_DEDUP_MAX_KEYS)
+
+# ==================== RATE LIMITING ====================
+
+# Peers allowed to report the client address in X-Forwarded-For, e.g. the
+# ingress in front of the app: "10.0.0.0/8,127.0.0.1"
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.environ.get('TRUSTED_PROXIES', '').split(',') if entry.strip()
+]
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# Behind an unconfigured proxy every visitor would share the proxy's "ip"
+# bucket, so that scope only applies once TRUSTED_PROXIES is set, or when the
+# app faces clients directly. The "user" and "short_code" scopes always apply.
+RATE_LIMIT_IP_SCOPE = os.environ.get('RATE_LIMIT_IP_SCOPE', 'true' if TRUSTED_PROXIES else 'false').lower() == 'true'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '100000'))
+
+# route -> scope -> [tokens per second, burst]
+DEFAULT_RATE_POLICIES = {
+    "redirect": {"ip": [20, 60]},
+    "verify": {"ip": [0.1, 5], "short_code": [0.5, 10]},
+    "login": {"ip": [0.2, 10], "user": [0.1, 5]},
+    "register": {"ip": [0.05, 5]}
+}
+RATE_POLICIES = {**DEFAULT_RATE_POLICIES, **json.loads(os.environ.get('RATE_LIMIT_POLICIES', '{}'))}
+
+class TokenBucketLimiter:
+    # In-memory token buckets. Buckets are kept in touch order, so the front
+    # of the dict is always the idlest one and eviction is amortized O(1).
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        # Returns 0 when allowed, otherwise seconds until a token is available
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        
+        retry_after = 0.0
+        if tokens < 1:
+            retry_after = (1 - tokens) / rate
+        else:
+            tokens -= 1
+        
+        # Third slot is when the bucket refills completely and can be forgotten
+        self.buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+        self.buckets.move_to_end(key)
+        self._evict(now)
+        return retry_after
+
+    def _evict(self, now: float):
+        while self.buckets:
+            key, bucket = next(iter(self.buckets.items()))
+            if bucket[2] > now and len(self.buckets) <= self.max_buckets:
+                break
+            self.buckets.popitem(last=False)
+
+class MongoRateLimitBackend:
+    # Fixed-window counters shared by all workers. Only consulted after the
+    # local bucket allowed the request, so rejected floods stay in memory.
+    async def start(self):
+        await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+
+    async def hit(self, key: str, rate: float, burst: float) -> float:
+        window = max(1, int(burst / rate))
+        now = time.time()
+        slot = int(now // window)
+        window_end = (slot + 1) * window
+        doc = await db.rate_limits.find_one_and_update(
+            {"_id": f"{key}:{slot}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": datetime.fromtimestamp(window_end, timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if doc["count"] > burst:
+            return window_end - now
+        return 0.0
+
+class RateLimiter:
+    def __init__(self, policies: dict, max_buckets: int, shared: Optional[MongoRateLimitBackend] = None):
+        self.policies = policies
+        self.local = TokenBucketLimiter(max_buckets)
+        self.shared = shared
+        self.rejected = 0
+
+    async def start(self):
+        if self.shared:
+            await self.shared.start()
+
+    async def check(self, route: str, **keys):
+        if not RATE_LIMIT_ENABLED:
+            return
+        for scope, (rate, burst) in self.policies.get(route, {}).items():
+            value = keys.get(scope)
+            if value is None or (scope == "ip" and not RATE_LIMIT_IP_SCOPE):
+                continue
+            key = f"{route}:{scope}:{value}"
+            retry_after = self.local.take(key, rate, burst)
+            if not retry_after and self.shared:
+                try:
+                    retry_after = await guarded(self.shared.hit, key, rate, burst)
+                except DatabaseUnavailable:
+                    # Local buckets still apply while the shared store is unreachable
+                    pass
+            if retry_after:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Çok fazla istek, lütfen daha sonra tekrar deneyin",
+                    headers={"Retry-After": str(math.ceil(retry_after))}
+                )
+
+rate_limiter = RateLimiter(
+    RATE_POLICIES,
+    RATE_LIMIT_MAX_BUCKETS,
+    MongoRateLimitBackend() if RATE_LIMIT_BACKEND == "mongo" else None
+)
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_ip(request: Request) -> Optional[str]:
+    address = request.client.host if request.client else None
+    if not TRUSTED_PROXIES or address is None or not is_trusted_proxy(address):
+        return address
+    # Walk the forwarded chain from the nearest hop, the first address that is
+    # not one of our proxies is the client. Anything left of it is spoofable.
+    forwarded = [hop.strip() for hop in ",".join(request.headers.getlist("x-forwarded-for")).split(",") if hop.strip()]
+    for hop in reversed(forwarded):
+        if not is_trusted_proxy(hop):
+            return hop
+        address = hop
+    return address
+
+# ==================== QR CODES ====================
+
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', 'https://besturl.pro')
+QR_CACHE_DIR = Path(os.environ.get('QR_CACHE_DIR', str(ROOT_DIR / 'qr_cache')))
+QR_MEMORY_ITEMS = int(os.environ.get('QR_MEMORY_ITEMS', '512'))
+QR_DISK_MAX_BYTES = int(os.environ.get('QR_DISK_MAX_BYTES', str(256 * 1024 * 1024)))
+QR_POOL_WORKERS = int(os.environ.get('QR_POOL_WORKERS', '2'))
+QR_MIN_SIZE = 64
+QR_MAX_SIZE = 2048
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+HEX_COLOR_RE = re.compile(r"^[0-9a-fA-F]{6}$")
+BULK_LINK_LIMIT = 500
+# Each password costs a bcrypt hash, a few hundred ms of CPU
+BULK_PASSWORD_LIMIT = int(os.environ.get('BULK_PASSWORD_LIMIT', '20'))
+
+def render_qr(data: str, size: int, fmt: str, fg: str, bg: str) -> bytes:
+    # Module level so it can run in the process pool
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    modules = len(matrix)
+    
+    if fmt == "svg":
+        path = "".join(
+            f"M{x},{y}h1v1h-1z"
+            for y, row in enumerate(matrix)
+            for x, dark in enumerate(row) if dark
+        )
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+            f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+            f'<rect width="{modules}" height="{modules}" fill="#{bg}"/>'
+            f'<path d="{path}" fill="#{fg}"/></svg>'
+        ).encode()
+    
+    # Two-colour palette image, scaled without smoothing
+    image = Image.new("P", (modules, modules))
+    image.putpalette([int(color[i:i + 2], 16) for color in (bg, fg) for i in (0, 2, 4)])
+    image.putdata([1 if dark else 0 for row in matrix for dark in row])
+    image = image.resize((size, size), Image.NEAREST)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+class QRCache:
+    # Content-addressed: a memory LRU in front of a disk tier. The disk tier
+    # is bounded by dropping the least recently used files.
+    def __init__(self, directory: Path, max_items: int, max_bytes: int):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.disk_bytes = None
+        self.disk_lock = threading.Lock()
+
+    @staticmethod
+    def key(short_code: str, size: int, fmt: str, fg: str, bg: str) -> str:
+        # The encoded URL includes the base URL, changing it must not serve old codes
+        raw = f"{PUBLIC_BASE_URL}|{short_code}|{size}|{fmt}|{fg}|{bg}".encode()
+        return hashlib.sha256(raw).hexdigest()[:32]
+
+    def _path(self, key: str, fmt: str) -> Path:
+        return self.directory / key[:2] / f"{key}.{fmt}"
+
+    def _remember(self, key: str, data: bytes):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def _read_disk(self, key: str, fmt: str) -> Optional[bytes]:
+        path = self._path(key, fmt)
+        try:
+            data = path.read_bytes()
+            # The mtime doubles as the last use for eviction
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, fmt: str, data: bytes):
+        path = self._path(key, fmt)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self.disk_lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += len(data)
+            if self.disk_bytes is None or self.disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Rescans the directory, so files written by other workers are counted too
+        files = []
+        for path in self.directory.glob("*/*"):
+            if path.suffix[1:] not in QR_FORMATS:
+                continue
+            try:
+                info = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((info.st_mtime, info.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            # Down to 90% so the next few writes do not rescan again
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self.disk_bytes = total
+
+    async def get(self, key: str, fmt: str) -> Optional[bytes]:
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+            return data
+        data = await asyncio.to_thread(self._read_disk, key, fmt)
+        if data is not None:
+            self._remember(key, data)
+        return data
+
+    async def put(self, key: str, fmt: str, data: bytes):
+        self._remember(key, data)
+        try:
+            await asyncio.to_thread(self._write_disk, key, fmt, data)
+        except OSError as e:
+            logger.warning(f"QR kod diske yazılamadı: {e}")
+
+qr_cache = QRCache(QR_CACHE_DIR, QR_MEMORY_ITEMS, QR_DISK_MAX_BYTES)
+qr_pool = None
+
+def get_qr_pool() -> ProcessPoolExecutor:
+    global qr_pool
+    if qr_pool is None:
+        # Forking would copy the SQLite, spool and profiler threads' locks
+        # into the children, spawned workers start clean
+        qr_pool = ProcessPoolExecutor(max_workers=QR_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return qr_pool
+
+def close_qr_pool():
+    global qr_pool
+    if qr_pool is not None:
+        qr_pool.shutdown(wait=False)
+        qr_pool = None
+
+def short_url(short_code: str) -> str:
+    return f"{PUBLIC_BASE_URL}/{short_code}"
+
+async def warm_qr_cache(short_codes: List[str], size: int = 256, fmt: str = "png", fg: str = "000000", bg: str = "ffffff"):
+    loop = asyncio.get_running_loop()
+    pool = get_qr_pool()
+    pending = []
+    for short_code in short_codes:
+        key = QRCache.key(short_code, size, fmt, fg, bg)
+        if await qr_cache.get(key, fmt) is None:
+            pending.append((key, loop.run_in_executor(pool, render_qr, short_url(short_code), size, fmt, fg, bg)))
+    for key, future in pending:
+        try:
+            await qr_cache.put(key, fmt, await future)
+        except Exception as e:
+            logger.warning(f"QR kod üretilemedi: {e}")
+
+# ==================== RETENTION ====================
+
+# Clicks older than RETENTION_DAYS are compacted into daily rollups and
+# archived as compressed column files, then deleted from the click store
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', '0'))
+RETENTION_INTERVAL_HOURS = float(os.environ.get('RETENTION_INTERVAL_HOURS', '24'))
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', '5000'))
+RETENTION_ARCHIVE_DIR = Path(os.environ.get('RETENTION_ARCHIVE_DIR', str(ROOT_DIR / 'click_archive')))
+ROLLUP_DIMENSIONS = ("devices", "browsers", "os_stats", "countries", "referrers")
+ARCHIVE_FORMAT = "besturl-clicks-v1"
+ARCHIVE_COLUMNS = ("id", "timestamp", "ip_address", "user_agent", "device_type", "browser", "os", "country", "city", "referrer")
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    # Stored timestamps are UTC ISO strings, so offsets must be converted before comparing
+    return value.astimezone(timezone.utc)
+
+def rollup_days(start: Optional[datetime], end: Optional[datetime]) -> tuple:
+    # Rollups cover whole UTC days. Raw clicks use [start, end), so an end
+    # at midnight must not pull in that day's rollups.
+    since_day = start.astimezone(timezone.utc).strftime("%Y-%m-%d") if start else None
+    until_day = None
+    if end:
+        end = end.astimezone(timezone.utc)
+        if end == end.replace(hour=0, minute=0, second=0, microsecond=0):
+            end -= timedelta(days=1)
+        until_day = end.strftime("%Y-%m-%d")
+    return since_day, until_day
+
+def build_rollups(link_id: str, segment: str, clicks: List[dict]) -> List[dict]:
+    days = {}
+    for click in clicks:
+        day = days.setdefault(click_day(click["timestamp"]), {"total": 0, **{key: {} for key in ROLLUP_DIMENSIONS}})
+        day["total"] += 1
+        for key, value in click_dimensions(click).items():
+            day[key][value] = day[key].get(value, 0) + 1
+    # Stored as [value, count] pairs since values like referrer URLs are not valid document keys
+    return [
+        {
+            "link_id": link_id,
+            "day": day,
+            "segment": segment,
+            "total": counters["total"],
+            **{key: [[value, count] for value, count in counters[key].items()] for key in ROLLUP_DIMENSIONS}
+        }
+        for day, counters in days.items()
+    ]
+
+def archive_path(link_id: str, month: str, segment: str) -> Path:
+    return RETENTION_ARCHIVE_DIR / link_id / month / f"{segment}.json.gz"
+
+def write_click_archive(link_id: str, month: str, segment: str, clicks: List[dict]):
+    # Column-oriented so repeated user agents, browsers and referrers compress well
+    payload = {
+        "format": ARCHIVE_FORMAT,
+        "link_id": link_id,
+        "month": month,
+        "count": len(clicks),
+        "columns": {column: [click.get(column) for click in clicks] for column in ARCHIVE_COLUMNS}
+    }
+    path = archive_path(link_id, month, segment)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(json.dumps(payload, separators=(",", ":")).encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+def list_click_archives(link_id: str, since_month: Optional[str] = None, until_month: Optional[str] = None) -> List[Path]:
+    base = RETENTION_ARCHIVE_DIR / link_id
+    if not base.is_dir():
+        return []
+    paths = []
+    for month_dir in sorted(base.iterdir()):
+        if since_month and month_dir.name < since_month:
+            continue
+        if until_month and month_dir.name > until_month:
+            continue
+        paths.extend(sorted(month_dir.glob("*.json.gz")))
+    return paths
+
+def load_click_archive(path: Path) -> List[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    columns = payload["columns"]
+    return [dict(zip(ARCHIVE_COLUMNS, row)) for row in zip(*(columns[column] for column in ARCHIVE_COLUMNS))]
+
+async def remove_click_archives(link_ids: List[str]):
+    for link_id in link_ids:
+        await asyncio.to_thread(shutil.rmtree, RETENTION_ARCHIVE_DIR / link_id, True)
+
+retention_lock = asyncio.Lock()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def lock_retention_archive():
+    # Every worker runs the job; the flock lets only one of them archive at a time
+    RETENTION_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    f = open(RETENTION_ARCHIVE_DIR / ".retention.lock", "ab")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
 
-# Create the main app
-app = FastAPI(title="LinkShortTR API")
+async def run_retention(days: int) -> dict:
+    cutoff_day = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = cutoff_day.isoformat()
+    summary = {"cutoff": cutoff, "links": 0, "clicks": 0, "files": 0}
+    
+    async with retention_lock:
+        lock_file = await asyncio.to_thread(lock_retention_archive)
+        if lock_file is None:
+            logger.info("Saklama işi başka bir işçide çalışıyor, atlandı")
+            return {**summary, "skipped": True}
+        try:
+            await archive_before(cutoff, summary)
+        finally:
+            lock_file.close()
+    
+    logger.info(f"Saklama işi tamamlandı: {summary}")
+    return summary
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+async def archive_before(cutoff: str, summary: dict):
+    for link_id in await storage.clicks.list_link_ids_before(cutoff):
+        summary["links"] += 1
+        while True:
+            clicks = await storage.clicks.list_before(link_id, cutoff, RETENTION_BATCH_SIZE)
+            if not clicks:
+                break
+            # Same batch, same segment: a retried batch replaces its files and rollups
+            segment = hashlib.sha256("|".join(click["id"] for click in clicks).encode()).hexdigest()[:16]
+            
+            by_month = {}
+            for click in clicks:
+                by_month.setdefault(click_day(click["timestamp"])[:7], []).append(click)
+            
+            # Nothing is deleted before its archive is durable on disk
+            for month, rows in by_month.items():
+                await asyncio.to_thread(write_click_archive, link_id, month, segment, rows)
+                summary["files"] += 1
+            await storage.clicks.upsert_rollups(build_rollups(link_id, segment, clicks))
+            await storage.clicks.delete_ids([click["id"] for click in clicks])
+            
+            summary["clicks"] += len(clicks)
+            if len(clicks) < RETENTION_BATCH_SIZE:
+                break
 
-# Logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+class RetentionJob:
+    def __init__(self):
+        self.task = None
 
-# ==================== MODELS ====================
+    async def run(self):
+        while True:
+            try:
+                await run_retention(RETENTION_DAYS)
+            except Exception as e:
+                logger.warning(f"Saklama işi başarısız: {e}")
+            await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
 
-class UserBase(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    username: str
-    email: str
+    async def start(self):
+        if RETENTION_DAYS > 0:
+            self.task = asyncio.create_task(self.run())
 
-class UserCreate(BaseModel):
-    username: str
-    email: str
-    password: str
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
 
-class UserLogin(BaseModel):
-    username: str
-    password: str
+retention_job = RetentionJob()
 
-class User(UserBase):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    is_admin: bool = False
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    is_active: bool = True
+# ==================== PROFILING ====================
 
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-    user: dict
+# Opt-in request instrumentation. While enabled, requests collect phase
+# timings and a watchdog thread samples the event loop thread, attributing
+# stacks to the request being run and capturing stalls. While disabled the
+# middleware is a single flag check and phase() returns a shared no-op.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_LOOP_LAG_MS = float(os.environ.get('PROFILE_LOOP_LAG_MS', '100'))
+PROFILE_SAMPLE_MS = float(os.environ.get('PROFILE_SAMPLE_MS', '5'))
+PROFILE_HISTORY = int(os.environ.get('PROFILE_HISTORY', '50'))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', str(ROOT_DIR / 'profiles')))
+PROFILE_NAME_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}\.folded$")
 
-class LinkCreate(BaseModel):
-    original_url: str
-    custom_slug: Optional[str] = None
-    title: Optional[str] = None
-    password: Optional[str] = None
-    expires_at: Optional[datetime] = None
-    generate_qr: bool = False
+request_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_phases", default=None)
 
-class LinkUpdate(BaseModel):
-    title: Optional[str] = None
-    password: Optional[str] = None
-    expires_at: Optional[datetime] = None
-    is_active: Optional[bool] = None
+class PhaseTimer:
+    def __init__(self, phases: Dict[str, float], name: str):
+        self.phases = phases
+        self.name = name
 
-class Link(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    user_id: str
-    original_url: str
-    short_code: str
-    title: Optional[str] = None
-    password_hash: Optional[str] = None
-    expires_at: Optional[datetime] = None
-    is_active: bool = True
-    click_count: int = 0
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    qr_code: Optional[str] = None
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
 
-class ClickEvent(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    link_id: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    ip_address: Optional[str] = None
-    user_agent: Optional[str] = None
-    device_type: str = "unknown"
-    browser: str = "unknown"
-    os: str = "unknown"
-    country: Optional[str] = None
-    city: Optional[str] = None
-    referrer: Optional[str] = None
+    def __exit__(self, *exc_info):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.phases[self.name] = self.phases.get(self.name, 0.0) + elapsed
 
-class LinkPasswordVerify(BaseModel):
-    password: str
+NO_PHASE = nullcontext()
 
-# ==================== HELPERS ====================
+def phase(name: str):
+    # Phases may nest, each one reports its own wall time in milliseconds
+    phases = request_phases.get()
+    if phases is None:
+        return NO_PHASE
+    return PhaseTimer(phases, name)
 
-def generate_short_code(length: int = 6) -> str:
-    chars = string.ascii_letters + string.digits
-    return ''.join(random.choices(chars, k=length))
+class TimedRepository:
+    # Wraps a repository while profiling is on so every call shows up as a db.* phase
+    def __init__(self, name: str, repository):
+        self.name = name
+        self.repository = repository
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    def __getattr__(self, attr: str):
+        value = getattr(self.repository, attr)
+        if not asyncio.iscoroutinefunction(value):
+            return value
+        label = f"db.{self.name}.{attr}"
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+        async def timed(*args, **kwargs):
+            with phase(label):
+                return await value(*args, **kwargs)
+        return timed
 
-def create_access_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+def collapse_stack(frame) -> str:
+    # Folded stack format, root first, as read by flamegraph.pl and speedscope
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
 
-async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Yetkilendirme gerekli")
+def write_profile(samples: Dict[str, int]) -> str:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}.folded"
+    with open(PROFILE_DIR / name, "w") as f:
+        for stack, count in samples.items():
+            f.write(f"{stack} {count}\n")
     
-    token = authorization.replace("Bearer ", "")
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Geçersiz token")
+    # Keep only the newest dumps
+    dumps = sorted(PROFILE_DIR.glob("*.folded"))
+    for old in dumps[:-PROFILE_HISTORY]:
+        old.unlink(missing_ok=True)
+    return name
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.slow_ms = PROFILE_SLOW_MS
+        self.loop_lag_ms = PROFILE_LOOP_LAG_MS
+        self.slow_requests = deque(maxlen=PROFILE_HISTORY)
+        self.stalls = deque(maxlen=PROFILE_HISTORY)
+        self.active: Dict[asyncio.Task, dict] = {}
+        self.stats = {"requests": 0, "slow": 0, "stalls": 0, "max_lag_ms": 0.0}
+        self.loop = None
+        self.loop_thread_id = None
+        self.heartbeat = 0.0
+        self.heartbeat_task = None
+        self.stop_event = None
+
+    async def enable(self):
+        if self.enabled:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.perf_counter()
+        self.heartbeat_task = asyncio.create_task(self.beat())
+        self.stop_event = threading.Event()
+        threading.Thread(target=self.watch, args=(self.stop_event,), name="profiler", daemon=True).start()
+        for name in ("users", "links", "clicks"):
+            setattr(storage, name, TimedRepository(name, getattr(storage, name)))
+        self.enabled = True
+        logger.info("Profil oluşturma açıldı")
+
+    async def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.stop_event.set()
+        self.heartbeat_task.cancel()
+        for name in ("users", "links", "clicks"):
+            repository = getattr(storage, name)
+            if isinstance(repository, TimedRepository):
+                setattr(storage, name, repository.repository)
+        self.active.clear()
+        logger.info("Profil oluşturma kapatıldı")
+
+    async def configure(self, settings: dict):
+        if settings.get("slow_ms") is not None:
+            self.slow_ms = settings["slow_ms"]
+        if settings.get("loop_lag_ms") is not None:
+            self.loop_lag_ms = settings["loop_lag_ms"]
+        if settings.get("enabled") is True:
+            await self.enable()
+        elif settings.get("enabled") is False:
+            await self.disable()
+
+    async def beat(self):
+        # The watchdog reads this timestamp, a stale one means the loop is blocked
+        interval = PROFILE_SAMPLE_MS / 1000
+        while True:
+            self.heartbeat = time.perf_counter()
+            await asyncio.sleep(interval)
+
+    def watch(self, stop_event: threading.Event):
+        # Runs in its own thread so it can observe the loop while it is blocked
+        interval = PROFILE_SAMPLE_MS / 1000
+        stall = None
+        while not stop_event.wait(interval):
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self.loop)
+            record = self.active.get(task) if task is not None else None
+            
+            lag_ms = (time.perf_counter() - self.heartbeat) * 1000 - PROFILE_SAMPLE_MS
+            self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], round(lag_ms, 1))
+            if lag_ms > self.loop_lag_ms:
+                if stall is None:
+                    stall = {
+                        "at": datetime.now(timezone.utc).isoformat(),
+                        "path": record["path"] if record else None,
+                        "lag_ms": round(lag_ms, 1),
+                        "stack": "".join(traceback.format_stack(frame))
+                    }
+                    self.stalls.append(stall)
+                    self.stats["stalls"] += 1
+                    logger.warning(f"Olay döngüsü bloke ({lag_ms:.0f} ms), yol: {stall['path']}\n{stall['stack']}")
+                else:
+                    stall["lag_ms"] = round(lag_ms, 1)
+            else:
+                stall = None
+            
+            if record is not None:
+                stack = collapse_stack(frame)
+                record["samples"][stack] = record["samples"].get(stack, 0) + 1
+
+    async def profile(self, app, scope, receive, send):
+        record = {"method": scope["method"], "path": scope["path"], "status": None, "streaming": False, "phases": {}, "samples": {}}
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                record["status"] = message["status"]
+                record["streaming"] = any(k == b"content-type" and v.startswith(b"text/event-stream") for k, v in message.get("headers", []))
+            await send(message)
+
+        task = asyncio.current_task()
+        self.active[task] = record
+        token = request_phases.set(record["phases"])
+        start = time.perf_counter()
+        try:
+            await app(scope, receive, send_timed)
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            request_phases.reset(token)
+            self.active.pop(task, None)
+            await self.finish(record, total_ms)
+
+    async def finish(self, record: dict, total_ms: float):
+        self.stats["requests"] += 1
+        # Live streams stay open by design, they are not slow requests
+        if total_ms < self.slow_ms or record["streaming"]:
+            return
+        self.stats["slow"] += 1
         
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token süresi dolmuş")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Geçersiz token")
+        phases = {name: round(ms, 2) for name, ms in record["phases"].items()}
+        samples = dict(record["samples"])
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "method": record["method"],
+            "path": record["path"],
+            "status": record["status"],
+            "total_ms": round(total_ms, 2),
+            "phases": phases,
+            "samples": sum(samples.values()),
+            "profile": None
+        }
+        if samples:
+            try:
+                entry["profile"] = await asyncio.to_thread(write_profile, samples)
+            except OSError as e:
+                logger.warning(f"Profil yazılamadı: {e}")
+        self.slow_requests.append(entry)
+        logger.warning(f"Yavaş istek: {record['method']} {record['path']} {total_ms:.0f} ms {phases}")
 
-def parse_user_agent(ua_string: str) -> dict:
-    try:
-        ua = parse(ua_string)
-        device_type = "mobile" if ua.is_mobile else ("tablet" if ua.is_tablet else "desktop")
+    def status(self) -> dict:
         return {
-            "device_type": device_type,
-            "browser": ua.browser.family or "unknown",
-            "os": ua.os.family or "unknown"
+            "enabled": self.enabled,
+            "slow_ms": self.slow_ms,
+            "loop_lag_ms": self.loop_lag_ms,
+            "worker_id": WORKER_ID,
+            "stats": self.stats,
+            "slow_requests": list(self.slow_requests),
+            "stalls": list(self.stalls)
         }
-    except:
-        return {"device_type": "unknown", "browser": "unknown", "os": "unknown"}
 
-def serialize_datetime(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    return obj
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        await profiler.profile(self.app, scope, receive, send)
+
+profiler = Profiler()
+invalidation_bus.register_config("profiling", profiler)
 
 # ==================== AUTH ROUTES ====================
 
 @api_router.post("/auth/register", response_model=Token)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, request: Request):
+    await rate_limiter.check("register", ip=client_ip(request))
+    
     # Check if username exists
-    existing = await db.users.find_one({"$or": [{"username": user_data.username}, {"email": user_data.email}]})
-    if existing:
+    if await storage.users.exists(user_data.username, user_data.email):
         raise HTTPException(status_code=400, detail="Kullanıcı adı veya e-posta zaten kayıtlı")
     
     user = User(
@@ -185,11 +3246,10 @@ async def register(user_data: UserCreate):
         email=user_data.email
     )
     user_dict = user.model_dump()
-    user_dict["password_hash"] = hash_password(user_data.password)
+    user_dict["password_hash"] = await hash_password_async(user_data.password)
     user_dict["created_at"] = user_dict["created_at"].isoformat()
     
-    insert_dict = user_dict.copy()
-    await db.users.insert_one(insert_dict)
+    await storage.users.insert(user_dict)
     
     access_token = create_access_token({"sub": user.id, "username": user.username, "is_admin": user.is_admin})
     return Token(
@@ -199,9 +3259,12 @@ async def register(user_data: UserCreate):
     )
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(login_data: UserLogin):
-    user = await db.users.find_one({"username": login_data.username}, {"_id": 0})
-    if not user or not verify_password(login_data.password, user.get("password_hash", "")):
+async def login(login_data: UserLogin, request: Request):
+    # Throttle before the user lookup and bcrypt verify
+    await rate_limiter.check("login", ip=client_ip(request), user=login_data.username)
+    
+    user = await storage.users.get_by_username(login_data.username)
+    if not user or not await verify_password_async(login_data.password, user.get("password_hash", "")):
         raise HTTPException(status_code=401, detail="Geçersiz kullanıcı adı veya şifre")
     
     if not user.get("is_active", True):
@@ -226,30 +3289,39 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 # ==================== LINK ROUTES ====================
 
-@api_router.post("/links")
-async def create_link(link_data: LinkCreate, current_user: dict = Depends(get_current_user)):
+async def insert_link(link_data: LinkCreate, user_id: str, reuse_existing: bool = False) -> dict:
+    destination_hash = url_hash(link_data.original_url)
+    
+    # Reuse only applies to plain requests, a slug, password or expiry asks for a distinct link
+    if (reuse_existing or link_data.reuse_existing) and not (link_data.custom_slug or link_data.password or link_data.expires_at):
+        existing = await storage.links.find_reusable(user_id, destination_hash)
+        if existing:
+            return {**public_link(existing), "reused": True}
+    
     # Generate or validate short code
     if link_data.custom_slug:
-        existing = await db.links.find_one({"short_code": link_data.custom_slug})
-        if existing:
+        if await storage.links.short_code_exists(link_data.custom_slug):
             raise HTTPException(status_code=400, detail="Bu kısa URL zaten kullanılıyor")
         short_code = link_data.custom_slug
     else:
         short_code = generate_short_code()
-        while await db.links.find_one({"short_code": short_code}):
+        while await storage.links.short_code_exists(short_code):
             short_code = generate_short_code()
     
     link = Link(
-        user_id=current_user["id"],
+        user_id=user_id,
         original_url=link_data.original_url,
         short_code=short_code,
         title=link_data.title or link_data.original_url[:50],
-        expires_at=link_data.expires_at
+        expires_at=link_data.expires_at,
+        url_hash=destination_hash
     )
+    if link_data.generate_qr:
+        link.qr_code = f"/api/links/{link.id}/qr"
     
     link_dict = link.model_dump()
     if link_data.password:
-        link_dict["password_hash"] = hash_password(link_data.password)
+        link_dict["password_hash"] = await hash_password_async(link_data.password)
     
     # Serialize datetime fields
     if link_dict.get("created_at"):
@@ -257,36 +3329,119 @@ async def create_link(link_data: LinkCreate, current_user: dict = Depends(get_cu
     if link_dict.get("expires_at"):
         link_dict["expires_at"] = link_dict["expires_at"].isoformat()
     
-    # Create a copy for insertion to avoid _id being added to response
-    insert_dict = link_dict.copy()
-    await db.links.insert_one(insert_dict)
+    await storage.links.insert(link_dict)
     
-    # Remove password_hash from response
-    link_dict.pop("password_hash", None)
-    link_dict.pop("_id", None)
-    link_dict["has_password"] = link_data.password is not None
+    return {**public_link(link_dict), "reused": False}
+
+@api_router.post("/links")
+async def create_link(link_data: LinkCreate, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    link_dict = await insert_link(link_data, current_user["id"])
+    
+    if link_data.generate_qr:
+        background_tasks.add_task(warm_qr_cache, [link_dict["short_code"]])
     
     return link_dict
 
+@api_router.post("/links/bulk")
+async def create_links_bulk(data: LinkBulkCreate, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    if len(data.links) > BULK_LINK_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Tek seferde en fazla {BULK_LINK_LIMIT} link oluşturulabilir")
+    if sum(1 for link_data in data.links if link_data.password) > BULK_PASSWORD_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Tek seferde en fazla {BULK_PASSWORD_LIMIT} şifreli link oluşturulabilir")
+    
+    created = []
+    errors = []
+    for index, link_data in enumerate(data.links):
+        try:
+            created.append(await insert_link(link_data, current_user["id"], data.reuse_existing))
+        except HTTPException as e:
+            errors.append({"index": index, "detail": e.detail})
+    
+    # Render all requested QR codes in one process pool batch
+    qr_codes = [link["short_code"] for link in created if link.get("qr_code")]
+    if qr_codes:
+        background_tasks.add_task(warm_qr_cache, qr_codes)
+    
+    return {"links": created, "errors": errors}
+
 @api_router.get("/links")
 async def get_links(current_user: dict = Depends(get_current_user)):
-    links = await db.links.find({"user_id": current_user["id"]}, {"_id": 0, "password_hash": 0}).sort("created_at", -1).to_list(1000)
+    links = await storage.links.list_by_user(current_user["id"])
+    return [public_link(link) for link in links]
+
+@api_router.get("/links/search")
+async def search_links(
+    q: Optional[str] = Query(None, max_length=200),
+    active: Optional[bool] = None,
+    expired: Optional[bool] = None,
+    protected: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    after = decode_cursor(cursor, 2) if cursor else None
+    links = await storage.links.search(
+        current_user["id"],
+        text=q.strip() if q else None,
+        active=active,
+        expired=expired,
+        protected=protected,
+        after=after,
+        limit=limit + 1
+    )
     
-    for link in links:
-        link["has_password"] = await db.links.find_one({"id": link["id"], "password_hash": {"$exists": True, "$ne": None}}) is not None
+    # One extra row tells whether there is a next page
+    next_cursor = None
+    if len(links) > limit:
+        links = links[:limit]
+        next_cursor = encode_cursor(links[-1]["created_at"], links[-1]["id"])
     
-    return links
+    return {"items": [public_link(link) for link in links], "next_cursor": next_cursor}
 
 @api_router.get("/links/{link_id}")
 async def get_link(link_id: str, current_user: dict = Depends(get_current_user)):
-    link = await db.links.find_one({"id": link_id, "user_id": current_user["id"]}, {"_id": 0, "password_hash": 0})
+    link = await storage.links.get(link_id, current_user["id"])
     if not link:
         raise HTTPException(status_code=404, detail="Link bulunamadı")
-    return link
+    return public_link(link)
+
+@api_router.get("/links/{link_id}/qr")
+async def get_link_qr(
+    link_id: str,
+    request: Request,
+    size: int = Query(256, ge=QR_MIN_SIZE, le=QR_MAX_SIZE),
+    fmt: str = Query("png", alias="format"),
+    fg: str = "000000",
+    bg: str = "ffffff",
+    current_user: dict = Depends(get_stream_user)
+):
+    if fmt not in QR_FORMATS:
+        raise HTTPException(status_code=400, detail="Desteklenmeyen QR formatı")
+    if not HEX_COLOR_RE.match(fg) or not HEX_COLOR_RE.match(bg):
+        raise HTTPException(status_code=400, detail="Geçersiz renk kodu")
+    fg, bg = fg.lower(), bg.lower()
+    
+    link = await storage.links.get(link_id, current_user["id"])
+    if not link:
+        raise HTTPException(status_code=404, detail="Link bulunamadı")
+    
+    key = QRCache.key(link["short_code"], size, fmt, fg, bg)
+    etag = f'"{key}"'
+    # The endpoint needs auth, so shared caches must not keep it
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    data = await qr_cache.get(key, fmt)
+    if data is None:
+        data = await asyncio.to_thread(render_qr, short_url(link["short_code"]), size, fmt, fg, bg)
+        await qr_cache.put(key, fmt, data)
+    
+    return Response(content=data, media_type=QR_FORMATS[fmt], headers=headers)
 
 @api_router.put("/links/{link_id}")
 async def update_link(link_id: str, link_data: LinkUpdate, current_user: dict = Depends(get_current_user)):
-    link = await db.links.find_one({"id": link_id, "user_id": current_user["id"]})
+    link = await storage.links.get(link_id, current_user["id"])
     if not link:
         raise HTTPException(status_code=404, detail="Link bulunamadı")
     
@@ -294,39 +3449,162 @@ async def update_link(link_id: str, link_data: LinkUpdate, current_user: dict =
     if link_data.title is not None:
         update_data["title"] = link_data.title
     if link_data.password is not None:
-        update_data["password_hash"] = hash_password(link_data.password) if link_data.password else None
+        update_data["password_hash"] = await hash_password_async(link_data.password) if link_data.password else None
+        # Revokes every outstanding unlock token
+        update_data["password_version"] = (link.get("password_version") or 0) + 1
     if link_data.expires_at is not None:
         update_data["expires_at"] = link_data.expires_at.isoformat() if link_data.expires_at else None
     if link_data.is_active is not None:
         update_data["is_active"] = link_data.is_active
     
     if update_data:
-        await db.links.update_one({"id": link_id}, {"$set": update_data})
+        await storage.links.update(link_id, update_data)
+        await invalidation_bus.publish("link", link["short_code"])
     
-    updated = await db.links.find_one({"id": link_id}, {"_id": 0, "password_hash": 0})
-    return updated
+    updated = await storage.links.get(link_id)
+    return public_link(updated)
 
 @api_router.delete("/links/{link_id}")
 async def delete_link(link_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.links.delete_one({"id": link_id, "user_id": current_user["id"]})
-    if result.deleted_count == 0:
+    link = await storage.links.get(link_id, current_user["id"])
+    if not link or not await storage.links.delete(link_id, current_user["id"]):
         raise HTTPException(status_code=404, detail="Link bulunamadı")
+    await invalidation_bus.publish("link", link["short_code"])
     
-    # Also delete click events
-    await db.clicks.delete_many({"link_id": link_id})
+    # Also delete click events, rollups and archives
+    await storage.clicks.delete_for_links([link_id])
+    await remove_click_archives([link_id])
     
     return {"message": "Link silindi"}
 
 # ==================== ANALYTICS ROUTES ====================
 
+ANALYTICS_BATCH_LIMIT = int(os.environ.get('ANALYTICS_BATCH_LIMIT', '500'))
+# Grouped batch queries allowed to run at once per worker
+ANALYTICS_BATCH_CONCURRENCY = int(os.environ.get('ANALYTICS_BATCH_CONCURRENCY', '4'))
+analytics_batch_slots = asyncio.Semaphore(ANALYTICS_BATCH_CONCURRENCY)
+
+def daily_series(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, int]:
+    # Zeroed days for the series window, 30 days unless a start is given
+    series_end = end or datetime.now(timezone.utc)
+    series_days = 30
+    if start:
+        series_days = min(max((series_end - start).days + 1, 1), 366)
+    return {(series_end - timedelta(days=i)).strftime("%Y-%m-%d"): 0 for i in range(series_days)}
+
+def empty_link_stats(days: Dict[str, int]) -> dict:
+    stats = {"total_clicks": 0, "bot_clicks": 0, "duplicate_clicks": 0}
+    stats.update({key: {} for key in ROLLUP_DIMENSIONS})
+    stats["daily_clicks"] = dict(days)
+    return stats
+
+def add_to_stats(stats: dict, day: Optional[str], total: int, dimensions: Dict[str, list]):
+    stats["total_clicks"] += total
+    for key, pairs in dimensions.items():
+        counter = stats[key]
+        for value, count in pairs:
+            counter[value] = counter.get(value, 0) + count
+    if day in stats["daily_clicks"]:
+        stats["daily_clicks"][day] += total
+
+@api_router.post("/analytics/batch")
+async def get_batch_analytics(data: AnalyticsBatchRequest, current_user: dict = Depends(get_current_user)):
+    # Ownership is checked with one query for the whole set
+    if data.link_ids is not None:
+        link_ids = list(dict.fromkeys(data.link_ids))
+        if len(link_ids) > ANALYTICS_BATCH_LIMIT:
+            raise HTTPException(status_code=400, detail=f"Tek seferde en fazla {ANALYTICS_BATCH_LIMIT} link karşılaştırılabilir")
+        links = await storage.links.get_many(link_ids, current_user["id"]) if link_ids else []
+    else:
+        links = await storage.links.search(
+            current_user["id"],
+            text=data.q.strip() if data.q else None,
+            active=data.active,
+            expired=data.expired,
+            protected=data.protected,
+            limit=ANALYTICS_BATCH_LIMIT + 1
+        )
+        if len(links) > ANALYTICS_BATCH_LIMIT:
+            raise HTTPException(status_code=400, detail=f"Tek seferde en fazla {ANALYTICS_BATCH_LIMIT} link karşılaştırılabilir")
+        link_ids = [link["id"] for link in links]
+    
+    found = {link["id"]: link for link in links}
+    # Unknown and foreign ids look the same to the caller
+    missing = [link_id for link_id in link_ids if link_id not in found]
+    owned = [link_id for link_id in link_ids if link_id in found]
+    
+    start, end = as_utc(data.start), as_utc(data.end)
+    days = daily_series(start, end)
+    per_link = {link_id: empty_link_stats(days) for link_id in owned}
+    combined = empty_link_stats(days)
+    
+    if owned:
+        # Clicks grouped by link, day and dimensions in the database, plus
+        # rollups and bot counters for the same set, each a single query
+        since_day, until_day = rollup_days(start, end)
+        async with analytics_batch_slots:
+            groups, rollups, bot_hits = await asyncio.gather(
+                storage.clicks.group_for_links(
+                    owned,
+                    since=start.isoformat() if start else None,
+                    until=end.isoformat() if end else None
+                ),
+                storage.clicks.list_rollups_for_links(
+                    owned,
+                    since_day=since_day,
+                    until_day=until_day
+                ),
+                storage.clicks.count_bot_hits_by_link(owned)
+            )
+        
+        with phase("analytics.aggregate"):
+            for group in groups:
+                dimensions = {key: [[value, group["clicks"]]] for key, value in click_dimensions(group).items()}
+                for stats in (per_link[group["link_id"]], combined):
+                    add_to_stats(stats, group["day"], group["clicks"], dimensions)
+            
+            for rollup in rollups:
+                dimensions = {key: rollup.get(key, []) for key in ROLLUP_DIMENSIONS}
+                for stats in (per_link[rollup["link_id"]], combined):
+                    add_to_stats(stats, rollup["day"], rollup["total"], dimensions)
+            
+            for link_id, stats in per_link.items():
+                stats["bot_clicks"] = bot_hits.get(link_id, 0)
+                stats["duplicate_clicks"] = found[link_id].get("duplicate_hits") or 0
+                combined["bot_clicks"] += stats["bot_clicks"]
+                combined["duplicate_clicks"] += stats["duplicate_clicks"]
+    
+    def series(stats: dict) -> dict:
+        stats["daily_clicks"] = [{"date": k, "clicks": v} for k, v in sorted(stats["daily_clicks"].items())]
+        return stats
+    
+    return {
+        "links": [{"link": public_link(found[link_id]), **series(per_link[link_id])} for link_id in owned],
+        "combined": series(combined),
+        "missing": missing
+    }
+
 @api_router.get("/links/{link_id}/analytics")
-async def get_link_analytics(link_id: str, current_user: dict = Depends(get_current_user)):
-    link = await db.links.find_one({"id": link_id, "user_id": current_user["id"]}, {"_id": 0})
+async def get_link_analytics(
+    link_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    link = await storage.links.get(link_id, current_user["id"])
     if not link:
         raise HTTPException(status_code=404, detail="Link bulunamadı")
+    link = public_link(link)
+    
+    # Optional historical range, defaults to everything with a 30 day series
+    start, end = as_utc(start), as_utc(end)
     
     # Get click events
-    clicks = await db.clicks.find({"link_id": link_id}, {"_id": 0}).sort("timestamp", -1).to_list(10000)
+    clicks = await storage.clicks.list_for_link(
+        link_id,
+        since=start.isoformat() if start else None,
+        until=end.isoformat() if end else None
+    )
     
     # Aggregate stats
     total_clicks = len(clicks)
@@ -338,46 +3616,50 @@ async def get_link_analytics(link_id: str, current_user: dict = Depends(get_curr
     countries = {}
     referrers = {}
     
-    # Daily clicks for last 30 days
-    daily_clicks = {}
-    now = datetime.now(timezone.utc)
-    for i in range(30):
-        day = (now - timedelta(days=i)).strftime("%Y-%m-%d")
-        daily_clicks[day] = 0
+    # Daily clicks for the series window
+    daily_clicks = daily_series(start, end)
     
-    for click in clicks:
-        # Device
-        device = click.get("device_type", "unknown")
-        devices[device] = devices.get(device, 0) + 1
-        
-        # Browser
-        browser = click.get("browser", "unknown")
-        browsers[browser] = browsers.get(browser, 0) + 1
-        
-        # OS
-        os_name = click.get("os", "unknown")
-        os_stats[os_name] = os_stats.get(os_name, 0) + 1
-        
-        # Country
-        country = click.get("country", "Bilinmiyor")
-        countries[country] = countries.get(country, 0) + 1
-        
-        # Referrer
-        referrer = click.get("referrer", "Doğrudan")
-        referrers[referrer] = referrers.get(referrer, 0) + 1
-        
-        # Daily
-        timestamp = click.get("timestamp")
-        if timestamp:
-            if isinstance(timestamp, str):
-                timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-            day = timestamp.strftime("%Y-%m-%d")
+    breakdowns = {
+        "devices": devices,
+        "browsers": browsers,
+        "os_stats": os_stats,
+        "countries": countries,
+        "referrers": referrers
+    }
+    
+    # Clicks compacted by the retention job only survive as daily rollups
+    since_day, until_day = rollup_days(start, end)
+    rollups = await storage.clicks.list_rollups(link_id, since_day=since_day, until_day=until_day)
+    
+    with phase("analytics.aggregate"):
+        for click in clicks:
+            # Device, browser, OS, country and referrer
+            for key, value in click_dimensions(click).items():
+                counter = breakdowns[key]
+                counter[value] = counter.get(value, 0) + 1
+            
+            # Daily
+            day = click_day(click.get("timestamp"))
             if day in daily_clicks:
                 daily_clicks[day] += 1
+        
+        for rollup in rollups:
+            total_clicks += rollup["total"]
+            for key, counter in breakdowns.items():
+                for value, count in rollup.get(key, []):
+                    counter[value] = counter.get(value, 0) + count
+            if rollup["day"] in daily_clicks:
+                daily_clicks[rollup["day"]] += rollup["total"]
+    
+    # Filtered bot hits are only kept as daily counters
+    bot_clicks = await storage.clicks.count_bot_hits(link_id)
     
     return {
         "link": link,
         "total_clicks": total_clicks,
+        "bot_clicks": bot_clicks,
+        # Repeat hits collapsed by the dedup window, all time
+        "duplicate_clicks": link.get("duplicate_hits") or 0,
         "devices": devices,
         "browsers": browsers,
         "os_stats": os_stats,
@@ -387,24 +3669,157 @@ async def get_link_analytics(link_id: str, current_user: dict = Depends(get_curr
         "recent_clicks": clicks[:100]
     }
 
+@api_router.get("/links/{link_id}/export")
+async def export_link_clicks(
+    link_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    link = await storage.links.get(link_id, current_user["id"])
+    if not link:
+        raise HTTPException(status_code=404, detail="Link bulunamadı")
+    
+    start, end = as_utc(start), as_utc(end)
+    since = start.isoformat() if start else None
+    until = end.isoformat() if end else None
+    archives = await asyncio.to_thread(
+        list_click_archives,
+        link_id,
+        start.strftime("%Y-%m") if start else None,
+        end.strftime("%Y-%m") if end else None
+    )
+    
+    def csv_rows(rows: List[dict]) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row.get(column) for column in ARCHIVE_COLUMNS])
+        return buffer.getvalue()
+    
+    async def export_stream():
+        yield ",".join(ARCHIVE_COLUMNS) + "\r\n"
+        # Archived clicks first, oldest month to newest, then what is still live
+        seen = set()
+        for path in archives:
+            rows = []
+            for click in await asyncio.to_thread(load_click_archive, path):
+                if click["id"] in seen:
+                    continue
+                if (since and click["timestamp"] < since) or (until and click["timestamp"] >= until):
+                    continue
+                seen.add(click["id"])
+                rows.append(click)
+            yield csv_rows(rows)
+        recent = await storage.clicks.list_for_link(link_id, None, since, until)
+        yield csv_rows(reversed(recent))
+    
+    return StreamingResponse(
+        export_stream(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="clicks-{link["short_code"]}.csv"'}
+    )
+
+@api_router.get("/links/{link_id}/clicks")
+async def list_link_clicks(
+    link_id: str,
+    device_type: Optional[str] = None,
+    browser: Optional[str] = None,
+    os_name: Optional[str] = Query(None, alias="os"),
+    country: Optional[str] = None,
+    referrer: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    link = await storage.links.get(link_id, current_user["id"])
+    if not link:
+        raise HTTPException(status_code=404, detail="Link bulunamadı")
+    
+    # An empty value selects clicks where the field was not recorded
+    values = (device_type, browser, os_name, country, referrer)
+    filters = {field: value or None for field, value in zip(CLICK_FILTER_FIELDS, values) if value is not None}
+    
+    start, end = as_utc(start), as_utc(end)
+    before = decode_cursor(cursor, 2) if cursor else None
+    clicks = await storage.clicks.page(
+        link_id,
+        filters,
+        since=start.isoformat() if start else None,
+        until=end.isoformat() if end else None,
+        before=before,
+        limit=limit + 1
+    )
+    
+    next_cursor = None
+    if len(clicks) > limit:
+        clicks = clicks[:limit]
+        next_cursor = encode_cursor(clicks[-1]["timestamp"], clicks[-1]["id"])
+    
+    return {"items": clicks, "next_cursor": next_cursor}
+
+@api_router.post("/links/{link_id}/stream-token")
+async def create_link_stream_token(link_id: str, current_user: dict = Depends(get_current_user)):
+    link = await storage.links.get(link_id, current_user["id"])
+    if not link:
+        raise HTTPException(status_code=404, detail="Link bulunamadı")
+    return {"token": create_stream_token(current_user["id"], link_id), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@api_router.get("/links/{link_id}/live")
+async def stream_link_live(link_id: str, request: Request, current_user: dict = Depends(get_stream_user)):
+    link = await storage.links.get(link_id, current_user["id"])
+    if not link:
+        raise HTTPException(status_code=404, detail="Link bulunamadı")
+    
+    queue = live_hub.subscribe(link_id)
+    try:
+        # Other workers start publishing this link's clicks from here on
+        await live_broker.watch(link_id)
+    except Exception as e:
+        logger.warning(f"Canlı izleme duyurulamadı: {e}")
+    
+    async def event_stream():
+        try:
+            yield sse_format("snapshot", {"click_count": link.get("click_count", 0)})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Fell too far behind, the client should reload and reconnect
+                    yield sse_format("dropped", {"reason": "slow_consumer"})
+                    break
+                yield sse_format("click", event)
+        finally:
+            live_hub.unsubscribe(link_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.get("/analytics/overview")
 async def get_analytics_overview(current_user: dict = Depends(get_current_user)):
     # Get user's links
-    links = await db.links.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(1000)
+    links = [public_link(link) for link in await storage.links.list_by_user(current_user["id"])]
     link_ids = [link["id"] for link in links]
     
     total_links = len(links)
     active_links = sum(1 for link in links if link.get("is_active", True))
     
     # Get total clicks
-    total_clicks = await db.clicks.count_documents({"link_id": {"$in": link_ids}})
+    total_clicks = await storage.clicks.count(link_ids) + await storage.clicks.count_rollups(link_ids)
     
     # Get today's clicks
     today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_clicks = await db.clicks.count_documents({
-        "link_id": {"$in": link_ids},
-        "timestamp": {"$gte": today_start.isoformat()}
-    })
+    today_clicks = await storage.clicks.count(link_ids, since=today_start.isoformat())
     
     # Top performing links
     top_links = sorted(links, key=lambda x: x.get("click_count", 0), reverse=True)[:5]
@@ -419,9 +3834,16 @@ async def get_analytics_overview(current_user: dict = Depends(get_current_user))
 
 # ==================== REDIRECT ROUTE ====================
 
-@api_router.get("/r/{short_code}")
-async def redirect_link(short_code: str, request: Request):
-    link = await db.links.find_one({"short_code": short_code}, {"_id": 0})
+async def resolve_redirect(short_code: str, request: Request, unlock: Optional[str]) -> Response:
+    await rate_limiter.check("redirect", ip=client_ip(request))
+    
+    try:
+        link = await get_link_by_short_code(short_code)
+    except DatabaseUnavailable:
+        # Degraded mode: serve the last known destination
+        link = await link_snapshot.get(short_code)
+        if link is None:
+            raise
     if not link:
         raise HTTPException(status_code=404, detail="Link bulunamadı")
     
@@ -437,68 +3859,67 @@ async def redirect_link(short_code: str, request: Request):
         if expires < datetime.now(timezone.utc):
             raise HTTPException(status_code=410, detail="Bu linkin süresi dolmuş")
     
-    # Check if password protected
+    # Check if password protected, a valid unlock token stands in for the password
     if link.get("password_hash"):
-        return {"requires_password": True, "link_id": link["id"]}
+        if not check_unlock_token(link, unlock or request.cookies.get(UNLOCK_COOKIE)):
+            return JSONResponse({"requires_password": True, "link_id": link["id"]})
     
     # Record click
-    ua_string = request.headers.get("user-agent", "")
-    ua_info = parse_user_agent(ua_string)
-    
-    click = ClickEvent(
-        link_id=link["id"],
-        ip_address=request.client.host if request.client else None,
-        user_agent=ua_string,
-        device_type=ua_info["device_type"],
-        browser=ua_info["browser"],
-        os=ua_info["os"],
-        referrer=request.headers.get("referer")
-    )
-    
-    click_dict = click.model_dump()
-    click_dict["timestamp"] = click_dict["timestamp"].isoformat()
-    insert_click = click_dict.copy()
-    await db.clicks.insert_one(insert_click)
-    
-    # Increment click count
-    await db.links.update_one({"id": link["id"]}, {"$inc": {"click_count": 1}})
+    await record_click(link, request)
     
     return RedirectResponse(url=link["original_url"], status_code=302)
 
+@api_router.api_route("/r/{short_code}", methods=["GET", "HEAD"])
+async def redirect_link(short_code: str, request: Request, unlock: Optional[str] = None):
+    return await resolve_redirect(short_code, request, unlock)
+
+# Redirects are the hot path. The fast route is a plain Starlette endpoint
+# mounted ahead of the API router, so it skips FastAPI's parameter and
+# response handling. Codes outside the generated alphabet do not match the
+# convertor and fall through to the regular route above.
+class ShortCodeConvertor(Convertor):
+    regex = "[A-Za-z0-9_-]{1,64}"
+
+    def convert(self, value: str) -> str:
+        return value
+
+    def to_string(self, value: str) -> str:
+        return value
+
+register_url_convertor("short_code", ShortCodeConvertor())
+
+async def fast_redirect(request: Request) -> Response:
+    return await resolve_redirect(request.path_params["short_code"], request, request.query_params.get("unlock"))
+
 @api_router.post("/r/{short_code}/verify")
-async def verify_link_password(short_code: str, data: LinkPasswordVerify, request: Request):
-    link = await db.links.find_one({"short_code": short_code}, {"_id": 0})
+async def verify_link_password(short_code: str, data: LinkPasswordVerify, request: Request, response: Response):
+    await rate_limiter.check("verify", ip=client_ip(request), short_code=short_code)
+    
+    link = await get_link_by_short_code(short_code)
     if not link:
         raise HTTPException(status_code=404, detail="Link bulunamadı")
     
     if not link.get("password_hash"):
         return RedirectResponse(url=link["original_url"], status_code=302)
     
-    if not verify_password(data.password, link["password_hash"]):
+    if not await verify_password_async(data.password, link["password_hash"]):
         raise HTTPException(status_code=401, detail="Yanlış şifre")
     
     # Record click
-    ua_string = request.headers.get("user-agent", "")
-    ua_info = parse_user_agent(ua_string)
-    
-    click = ClickEvent(
-        link_id=link["id"],
-        ip_address=request.client.host if request.client else None,
-        user_agent=ua_string,
-        device_type=ua_info["device_type"],
-        browser=ua_info["browser"],
-        os=ua_info["os"],
-        referrer=request.headers.get("referer")
-    )
+    await record_click(link, request)
     
-    click_dict = click.model_dump()
-    click_dict["timestamp"] = click_dict["timestamp"].isoformat()
-    insert_click = click_dict.copy()
-    await db.clicks.insert_one(insert_click)
-    
-    await db.links.update_one({"id": link["id"]}, {"$inc": {"click_count": 1}})
+    unlock_token = issue_unlock_token(link)
+    response.set_cookie(
+        UNLOCK_COOKIE,
+        unlock_token,
+        max_age=UNLOCK_TOKEN_EXPIRE_SECONDS,
+        path=f"/api/r/{quote(short_code)}",
+        httponly=True,
+        secure=request.url.scheme == "https",
+        samesite="lax"
+    )
     
-    return {"redirect_url": link["original_url"]}
+    return {"redirect_url": link["original_url"], "unlock_token": unlock_token, "unlock_expires_in": UNLOCK_TOKEN_EXPIRE_SECONDS}
 
 # ==================== ADMIN ROUTES ====================
 
@@ -509,14 +3930,14 @@ async def require_admin(current_user: dict = Depends(get_current_user)):
 
 @api_router.get("/admin/stats")
 async def get_admin_stats(admin: dict = Depends(require_admin)):
-    total_users = await db.users.count_documents({})
-    total_links = await db.links.count_documents({})
-    total_clicks = await db.clicks.count_documents({})
+    total_users = await storage.users.count()
+    total_links = await storage.links.count()
+    total_clicks = await storage.clicks.count() + await storage.clicks.count_rollups()
     
     # Today's stats
     today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_clicks = await db.clicks.count_documents({"timestamp": {"$gte": today_start.isoformat()}})
-    today_links = await db.links.count_documents({"created_at": {"$gte": today_start.isoformat()}})
+    today_clicks = await storage.clicks.count(since=today_start.isoformat())
+    today_links = await storage.links.count(created_since=today_start.isoformat())
     
     return {
         "total_users": total_users,
@@ -528,27 +3949,28 @@ async def get_admin_stats(admin: dict = Depends(require_admin)):
 
 @api_router.get("/admin/users")
 async def get_all_users(admin: dict = Depends(require_admin)):
-    users = await db.users.find({}, {"_id": 0, "password_hash": 0}).to_list(1000)
+    users = await storage.users.list()
     
     for user in users:
-        user["link_count"] = await db.links.count_documents({"user_id": user["id"]})
+        user["link_count"] = await storage.links.count(user_id=user["id"])
     
     return users
 
 @api_router.put("/admin/users/{user_id}/toggle-status")
 async def toggle_user_status(user_id: str, admin: dict = Depends(require_admin)):
-    user = await db.users.find_one({"id": user_id})
+    user = await storage.users.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
     
     new_status = not user.get("is_active", True)
-    await db.users.update_one({"id": user_id}, {"$set": {"is_active": new_status}})
+    await storage.users.update(user_id, {"is_active": new_status})
+    await invalidation_bus.publish("user", user_id)
     
     return {"message": "Kullanıcı durumu güncellendi", "is_active": new_status}
 
 @api_router.delete("/admin/users/{user_id}")
 async def delete_user(user_id: str, admin: dict = Depends(require_admin)):
-    user = await db.users.find_one({"id": user_id})
+    user = await storage.users.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
     
@@ -556,20 +3978,91 @@ async def delete_user(user_id: str, admin: dict = Depends(require_admin)):
         raise HTTPException(status_code=400, detail="Admin kullanıcı silinemez")
     
     # Delete user's links and clicks
-    user_links = await db.links.find({"user_id": user_id}, {"id": 1}).to_list(10000)
+    user_links = await storage.links.list_keys_by_user(user_id)
     link_ids = [link["id"] for link in user_links]
     
-    await db.clicks.delete_many({"link_id": {"$in": link_ids}})
-    await db.links.delete_many({"user_id": user_id})
-    await db.users.delete_one({"id": user_id})
+    await storage.clicks.delete_for_links(link_ids)
+    await remove_click_archives(link_ids)
+    await storage.links.delete_by_user(user_id)
+    await storage.users.delete(user_id)
+    
+    await invalidation_bus.publish("user", user_id)
+    for link in user_links:
+        await invalidation_bus.publish("link", link["short_code"])
     
     return {"message": "Kullanıcı ve tüm verileri silindi"}
 
+@api_router.get("/admin/bot-filter")
+async def get_bot_filter(admin: dict = Depends(require_admin)):
+    return {"rules": bot_filter.rules, "stats": bot_filter.stats, "dedup": click_deduper.stats}
+
+@api_router.post("/admin/bot-filter/reload")
+async def reload_bot_filter(admin: dict = Depends(require_admin)):
+    try:
+        rules = bot_filter.load()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Bot kuralları yüklenemedi: {e}")
+    # The rules read here are sent as is, so every worker ends up with the same set
+    await invalidation_bus.publish_config("bot_filter", {"rules": rules})
+    return {"message": "Bot kuralları yeniden yüklendi", "rules": bot_filter.rules}
+
+@api_router.post("/admin/retention/run")
+async def run_retention_now(days: Optional[int] = None, admin: dict = Depends(require_admin)):
+    days = days if days is not None else RETENTION_DAYS
+    if days <= 0:
+        raise HTTPException(status_code=400, detail="Saklama süresi belirtilmeli")
+    return await run_retention(days)
+
+@api_router.get("/admin/spool")
+async def get_spool_metrics(admin: dict = Depends(require_admin)):
+    return {
+        "enabled": SPOOL_ENABLED,
+        "degraded": db_health.degraded,
+        "degraded_since": db_health.degraded_since,
+        "last_error": db_health.last_error,
+        "trips": db_health.trips,
+        "spool": await click_spool.metrics(),
+        "snapshot": {**link_snapshot.stats, "links": await link_snapshot.count()}
+    }
+
+@api_router.post("/admin/spool/replay")
+async def replay_spool(admin: dict = Depends(require_admin)):
+    return {"replayed": await click_spool.replay(), "spool": await click_spool.metrics()}
+
+@api_router.get("/admin/profiling")
+async def get_profiling(admin: dict = Depends(require_admin)):
+    return profiler.status()
+
+@api_router.put("/admin/profiling")
+async def update_profiling(data: ProfilingUpdate, admin: dict = Depends(require_admin)):
+    await invalidation_bus.publish_config("profiling", data.model_dump(exclude_none=True))
+    return profiler.status()
+
+@api_router.get("/admin/profiling/profiles/{name}")
+async def get_profile_dump(name: str, admin: dict = Depends(require_admin)):
+    path = PROFILE_DIR / name
+    if not PROFILE_NAME_RE.match(name) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profil bulunamadı")
+    return Response(content=await asyncio.to_thread(path.read_bytes), media_type="text/plain")
+
 # ==================== SETUP ADMIN ====================
 
+@app.exception_handler(DatabaseUnavailable)
+async def database_unavailable_handler(request: Request, exc: DatabaseUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servis geçici olarak kullanılamıyor"},
+        headers={"Retry-After": str(math.ceil(SPOOL_RETRY_SECONDS))}
+    )
+
+@app.on_event("startup")
+async def start_storage():
+    # Registered first so the other startup hooks can use it
+    await storage.start()
+
 @app.on_event("startup")
 async def setup_admin():
-    admin = await db.users.find_one({"username": "venomcomeback"})
+    admin = await storage.users.get_by_username("venomcomeback")
     if not admin:
         admin_user = User(
             username="venomcomeback",
@@ -579,10 +4072,44 @@ async def setup_admin():
         admin_dict = admin_user.model_dump()
         admin_dict["password_hash"] = hash_password(os.environ.get('ADMIN_PASSWORD', 'change_me_in_production'))
         admin_dict["created_at"] = admin_dict["created_at"].isoformat()
-        insert_dict = admin_dict.copy()
-        await db.users.insert_one(insert_dict)
+        await storage.users.insert(admin_dict)
         logger.info("Admin kullanıcı oluşturuldu: venomcomeback")
 
+@app.on_event("startup")
+async def start_live_broker():
+    await live_broker.start()
+
+@app.on_event("startup")
+async def start_bot_filter():
+    await bot_filter.start()
+
+@app.on_event("startup")
+async def start_click_deduper():
+    await click_deduper.start()
+
+@app.on_event("startup")
+async def start_spool():
+    if SPOOL_ENABLED:
+        await link_snapshot.start()
+        await click_spool.start()
+
+@app.on_event("startup")
+async def start_rate_limiter():
+    await rate_limiter.start()
+
+@app.on_event("startup")
+async def start_invalidation_bus():
+    await invalidation_bus.start()
+
+@app.on_event("startup")
+async def start_retention_job():
+    await retention_job.start()
+
+@app.on_event("startup")
+async def start_profiler():
+    if PROFILING_ENABLED:
+        await profiler.enable()
+
 # ==================== ROOT ROUTES ====================
 
 @api_router.get("/")
@@ -596,6 +4123,9 @@ async def health_check():
 # Include the router
 app.include_router(api_router)
 
+if REDIRECT_FAST_PATH:
+    app.router.routes.insert(0, Route("/api/r/{short_code:short_code}", fast_redirect, methods=["GET", "HEAD"]))
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -605,6 +4135,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so timings cover the whole request
+app.add_middleware(ProfilingMiddleware)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await live_broker.stop()
+    await bot_filter.stop()
+    await click_deduper.stop()
+    if SPOOL_ENABLED:
+        await click_spool.stop()
+        await link_snapshot.stop()
+    await invalidation_bus.stop()
+    await retention_job.stop()
+    await profiler.disable()
+    close_qr_pool()
+    await storage.close()
+    if client is not None:
+        client.close()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# The benchmark drives the app in-process against a throwaway SQLite store
+WORK_DIR = tempfile.mkdtemp(prefix="besturl-bench-")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(WORK_DIR, "bench.db"))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("INVALIDATION_TRANSPORT", "none")
+# Every request comes from the same visitor, keep each one a full click
+os.environ.setdefault("CLICK_DEDUP_SECONDS", "0")
+os.environ.setdefault("BOT_RULES_FILE", os.path.join(WORK_DIR, "bot_rules.json"))
+os.environ.setdefault("QR_CACHE_DIR", os.path.join(WORK_DIR, "qr_cache"))
+os.environ.setdefault("SPOOL_DIR", os.path.join(WORK_DIR, "click_spool"))
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+# Link preview crawlers that fetch a shared link, mixed in with real visitors
+BOT_USER_AGENTS = [
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)",
+    "TelegramBot (like TwitterBot)",
+    "WhatsApp/2.23.20.0 A",
+]
+
+class RedirectBenchmark:
+    def __init__(self, requests: int = 5000):
+        self.requests = requests
+        self.short_code = None
+        self.fast_route = None
+
+    def log(self, message: str):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
+    async def call(self, path: str, user_agent: str = USER_AGENT) -> int:
+        """Send one GET straight through the ASGI app"""
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"bench"), (b"user-agent", user_agent.encode())],
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        status = 0
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await server.app(scope, receive, send)
+        return status
+
+    async def setup(self):
+        await server.app.router.startup()
+        link = server.Link(original_url="https://example.com/landing", short_code="bench1", user_id="bench")
+        link_dict = link.model_dump()
+        link_dict["created_at"] = link_dict["created_at"].isoformat()
+        await server.storage.links.insert(link_dict)
+        self.short_code = link.short_code
+        self.fast_route = server.app.router.routes[0] if server.REDIRECT_FAST_PATH else None
+
+    async def measure(self, label: str) -> float:
+        path = f"/api/r/{self.short_code}"
+        # Warm caches (link, UA parser) so both runs measure the steady state
+        for _ in range(50):
+            assert await self.call(path) == 302
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for _ in range(self.requests):
+            await self.call(path)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        per_request = cpu / self.requests * 1e6
+        self.log(f"{label}: {per_request:.1f} µs CPU/istek, {self.requests / wall:.0f} istek/sn")
+        return per_request
+
+    async def measure_bot_traffic(self, bot_share: float = 0.4):
+        """Mixed human and crawler traffic: persisted vs filtered hits"""
+        path = f"/api/r/{self.short_code}"
+        bots = int(self.requests * bot_share)
+        user_agents = [BOT_USER_AGENTS[i % len(BOT_USER_AGENTS)] for i in range(bots)] + [USER_AGENT] * (self.requests - bots)
+        random.Random(0).shuffle(user_agents)
+        before = dict(server.bot_filter.stats)
+        cpu_start = time.process_time()
+        for user_agent in user_agents:
+            await self.call(path, user_agent)
+        cpu = time.process_time() - cpu_start
+        persisted = server.bot_filter.stats["persisted"] - before["persisted"]
+        filtered = server.bot_filter.stats["filtered"] - before["filtered"]
+        self.log(
+            f"Bot trafiği (%{bot_share * 100:.0f} bot, mod {server.bot_filter.rules['mode']}): "
+            f"{persisted} kayıt, {filtered} filtrelendi, {cpu / self.requests * 1e6:.1f} µs CPU/istek"
+        )
+        return persisted, filtered
+
+    def measure_click_record(self) -> tuple[float, float]:
+        """Per-click record construction: Pydantic model vs plain dict"""
+        ua_info = server.parse_user_agent(USER_AGENT)
+        n = self.requests * 10
+
+        start = time.process_time()
+        for _ in range(n):
+            click = server.ClickEvent(link_id="bench", ip_address="127.0.0.1", user_agent=USER_AGENT,
+                                      device_type=ua_info["device_type"], browser=ua_info["browser"],
+                                      os=ua_info["os"], referrer=None)
+            click_dict = click.model_dump()
+            click_dict["timestamp"] = click_dict["timestamp"].isoformat()
+            click_dict.copy()
+        model = (time.process_time() - start) / n * 1e6
+
+        start = time.process_time()
+        for _ in range(n):
+            {
+                "id": server.next_click_id(),
+                "link_id": "bench",
+                "timestamp": datetime.now(server.timezone.utc).isoformat(),
+                "ip_address": "127.0.0.1",
+                "user_agent": USER_AGENT,
+                "device_type": ua_info["device_type"],
+                "browser": ua_info["browser"],
+                "os": ua_info["os"],
+                "country": None,
+                "city": None,
+                "referrer": None
+            }
+        plain = (time.process_time() - start) / n * 1e6
+        return model, plain
+
+    async def run(self):
+        await self.setup()
+        try:
+            model, plain = self.measure_click_record()
+            self.log(f"Tıklama kaydı: ClickEvent {model:.2f} µs, dict {plain:.2f} µs")
+
+            fast = await self.measure("Hızlı yol") if self.fast_route else None
+
+            # Same app with the fast route unmounted, i.e. the APIRouter handler
+            if self.fast_route:
+                server.app.router.routes.remove(self.fast_route)
+            routed = await self.measure("APIRouter")
+            if self.fast_route:
+                server.app.router.routes.insert(0, self.fast_route)
+
+            if fast:
+                self.log(f"CPU kazancı: %{(1 - fast / routed) * 100:.1f}")
+
+            await self.measure_bot_traffic()
+        finally:
+            await server.app.router.shutdown()
+            shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    asyncio.run(RedirectBenchmark(requests).run())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -192,6 +192,26 @@ class LinkShortenerAPITester:
         
         return False
     
+    def test_search_links(self) -> bool:
+        """Test searching links by title and protected filter"""
+        if not self.created_links:
+            return False
+            
+        link = self.created_links[0]
+        success, response = self.make_request('GET', f"/links/search?q={link.get('title')}&limit=10")
+        
+        if not success or not any(item.get('id') == link.get('id') for item in response.get('items', [])):
+            self.log(f"  ✗ Link not found by title")
+            return False
+        self.log(f"  ✓ Found {len(response['items'])} links by title")
+        
+        success, response = self.make_request('GET', '/links/search?protected=true')
+        if success and all(item.get('has_password') for item in response.get('items', [])):
+            self.log(f"  ✓ Protected filter returned {len(response['items'])} links")
+            return True
+        
+        return False
+    
     def test_link_redirect(self) -> bool:
         """Test short link redirect functionality"""
         if not self.created_links:
@@ -249,6 +269,100 @@ class LinkShortenerAPITester:
         
         return False
     
+    def test_link_clicks(self) -> bool:
+        """Test paging through a link's click events"""
+        if not self.created_links:
+            return False
+            
+        link_id = self.created_links[0].get('id')
+        if not link_id:
+            return False
+            
+        success, response = self.make_request('GET', f'/links/{link_id}/clicks?limit=1')
+        
+        if not success or 'items' not in response:
+            return False
+        self.log(f"  ✓ First page: {len(response['items'])} clicks")
+        
+        cursor = response.get('next_cursor')
+        if cursor:
+            success, response = self.make_request('GET', f'/links/{link_id}/clicks?limit=1&cursor={cursor}')
+            if not success:
+                return False
+            self.log(f"  ✓ Next page: {len(response['items'])} clicks")
+        return True
+    
+    def test_batch_analytics(self) -> bool:
+        """Test combined analytics for several links"""
+        if not self.created_links:
+            return False
+            
+        link_ids = [link['id'] for link in self.created_links if link.get('id')]
+        success, response = self.make_request('POST', '/analytics/batch', {"link_ids": link_ids})
+        
+        if not success or 'combined' not in response:
+            return False
+        self.log(f"  ✓ {len(response['links'])} links, {response['combined']['total_clicks']} clicks combined")
+        return len(response['links']) == len(link_ids)
+    
+    def test_link_qr(self) -> bool:
+        """Test server-side QR code generation and caching headers"""
+        if not self.created_links:
+            return False
+            
+        link_id = self.created_links[0].get('id')
+        if not link_id:
+            return False
+            
+        url = f"{self.base_url}/links/{link_id}/qr"
+        headers = {'Authorization': f'Bearer {self.token}'}
+        
+        try:
+            response = requests.get(url, params={'size': 256, 'format': 'png'}, headers=headers)
+            if response.status_code != 200 or response.headers.get('Content-Type') != 'image/png':
+                self.log(f"  ✗ Status: {response.status_code}")
+                return False
+            self.log(f"  ✓ QR PNG: {len(response.content)} bytes")
+            
+            etag = response.headers.get('ETag')
+            cached = requests.get(url, params={'size': 256, 'format': 'png'}, headers={**headers, 'If-None-Match': etag})
+            if cached.status_code == 304:
+                self.log(f"  ✓ ETag revalidation working")
+                return True
+            
+            self.log(f"  ✗ Expected 304, got {cached.status_code}")
+            return False
+            
+        except Exception as e:
+            self.log(f"  ✗ QR test failed: {str(e)}")
+            return False
+    
+    def test_link_live_stream(self) -> bool:
+        """Test live click stream (SSE) for a link"""
+        if not self.created_links:
+            return False
+            
+        link_id = self.created_links[0].get('id')
+        if not link_id:
+            return False
+            
+        url = f"{self.base_url}/links/{link_id}/live"
+        
+        try:
+            with requests.get(url, params={'token': self.token}, stream=True, timeout=10) as response:
+                if response.status_code != 200:
+                    self.log(f"  ✗ Status: {response.status_code}")
+                    return False
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('event: snapshot'):
+                        self.log(f"  ✓ Snapshot event received")
+                        return True
+            return False
+            
+        except Exception as e:
+            self.log(f"  ✗ Live stream test failed: {str(e)}")
+            return False
+    
     def test_analytics_overview(self) -> bool:
         """Test user analytics overview"""
         if not self.token:
@@ -372,7 +486,9 @@ class LinkShortenerAPITester:
         self.run_test("Create Basic Link", self.test_create_link)
         self.run_test("Create Protected Link", self.test_create_protected_link)
         self.run_test("Get Links List", self.test_get_links_list)
+        self.run_test("Search Links", self.test_search_links)
         self.run_test("Update Link", self.test_link_update)
+        self.run_test("Link QR Code", self.test_link_qr)
         
         # Redirect and password tests
         self.run_test("Link Redirect", self.test_link_redirect)
@@ -380,6 +496,9 @@ class LinkShortenerAPITester:
         
         # Analytics tests
         self.run_test("Link Analytics", self.test_link_analytics)
+        self.run_test("Link Clicks", self.test_link_clicks)
+        self.run_test("Batch Analytics", self.test_batch_analytics)
+        self.run_test("Link Live Stream", self.test_link_live_stream)
         self.run_test("Analytics Overview", self.test_analytics_overview)
         
         # Admin tests (if admin user)
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The server reads its configuration at import time, point everything that
+# touches disk at a scratch directory and use the embedded SQLite engine
+WORK_DIR = tempfile.mkdtemp(prefix="besturl-tests-")
+os.environ.pop("MONGO_URL", None)
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(WORK_DIR, "besturl.db")
+os.environ["INVALIDATION_TRANSPORT"] = "none"
+os.environ["SPOOL_DIR"] = os.path.join(WORK_DIR, "click_spool")
+os.environ["BOT_RULES_FILE"] = os.path.join(WORK_DIR, "bot_rules.json")
+os.environ["QR_CACHE_DIR"] = os.path.join(WORK_DIR, "qr_cache")
+os.environ["RETENTION_ARCHIVE_DIR"] = os.path.join(WORK_DIR, "click_archive")
+os.environ["PROFILE_DIR"] = os.path.join(WORK_DIR, "profiles")
+os.environ["CLICK_DEDUP_SECONDS"] = "0"
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+@pytest.fixture
+def client(tmp_path):
+    server.storage = server.SQLiteStorage(str(tmp_path / "besturl.db"))
+    server.link_cache.entries.clear()
+    server.user_cache.entries.clear()
+    server.rate_limiter.local.buckets.clear()
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+def register(client, username: str) -> dict:
+    response = client.post("/api/auth/register", json={"username": username, "email": f"{username}@example.com", "password": "secret"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
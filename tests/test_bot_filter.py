@@ -0,0 +1,84 @@
+import pytest
+from starlette.requests import Request
+
+import server
+
+def make_request(method: str = "GET") -> Request:
+    return Request({"type": "http", "method": method, "path": "/", "headers": [], "client": ("198.51.100.1", 1234)})
+
+IN_APP_BROWSERS = [
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 [LinkedInApp]/9.29.1",
+    "Mozilla/5.0 (Linux; Android 13; SM-S911B Build/TP1A.220624.014; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/119.0.6045.163 Mobile Safari/537.36 [Pinterest/Android]",
+    "Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36 Telegram-Android/10.8.1 (Google Pixel 7; Android 13; SDK 33; HIGH)",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Discord/207.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Slack/23.11.10",
+]
+
+PREVIEW_CRAWLERS = [
+    "LinkedInBot/1.0 (compatible; Mozilla/5.0; Apache-HttpClient +http://www.linkedin.com)",
+    "Pinterestbot/1.0 (+http://www.pinterest.com/bot.html)",
+    "TelegramBot (like TwitterBot)",
+    "Mozilla/5.0 (compatible; Discordbot/2.0; +https://discordapp.com)",
+    "Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)",
+    "Slack-ImgProxy (+https://api.slack.com/robots)",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "WhatsApp/2.23.20.0 A",
+]
+
+@pytest.mark.parametrize("ua_string", IN_APP_BROWSERS)
+def test_in_app_browsers_are_visitors(ua_string):
+    assert server.bot_filter.classify(make_request(), ua_string) is None
+    assert server.parse_user_agent(ua_string)["is_bot"] is False
+
+@pytest.mark.parametrize("ua_string", PREVIEW_CRAWLERS)
+def test_preview_crawlers_are_filtered(ua_string):
+    assert server.bot_filter.classify(make_request(), ua_string) == "signature"
+
+def test_failed_flush_keeps_counts(client, monkeypatch):
+    async def unavailable(hits):
+        raise server.sqlite3.OperationalError("database is locked")
+
+    bot_filter = server.BotFilter(server.BOT_RULES_FILE)
+    bot_filter.record("a", "head")
+    with monkeypatch.context() as patched:
+        patched.setattr(server.storage.clicks, "add_bot_hits", unavailable)
+        with pytest.raises(server.sqlite3.OperationalError):
+            client.portal.call(bot_filter.flush)
+    bot_filter.record("a", "head")
+    assert list(bot_filter.pending.values()) == [{"head": 2}]
+
+    client.portal.call(bot_filter.flush)
+    assert client.portal.call(server.storage.clicks.count_bot_hits, "a") == 2
+
+def test_reload_is_broadcast(client, monkeypatch, tmp_path):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    rules_file = tmp_path / "bot_rules.json"
+    rules_file.write_text('{"mode": "skip"}')
+    monkeypatch.setattr(server.invalidation_bus.channel, "send", send)
+    monkeypatch.setattr(server.bot_filter, "rules_file", str(rules_file))
+    response = client.post("/api/auth/login", json={"username": "venomcomeback", "password": "change_me_in_production"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    try:
+        assert client.post("/api/admin/bot-filter/reload", headers=headers).json()["rules"]["mode"] == "skip"
+        assert sent[-1]["name"] == "bot_filter"
+        assert sent[-1]["settings"]["rules"]["mode"] == "skip"
+    finally:
+        server.bot_filter.use(server.DEFAULT_BOT_RULES)
+
+def test_rules_received_from_another_worker(client):
+    rules = {**server.DEFAULT_BOT_RULES, "mode": "off"}
+    message = {"type": "config", "name": "bot_filter", "settings": {"rules": rules}, "version": server.EntityCache.version()}
+
+    async def receive():
+        server.invalidation_bus.apply(message)
+        await server.asyncio.sleep(0.05)
+        return server.bot_filter.enabled
+
+    try:
+        assert client.portal.call(receive) is False
+    finally:
+        server.bot_filter.use(server.DEFAULT_BOT_RULES)
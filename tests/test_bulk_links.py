@@ -0,0 +1,36 @@
+import server
+from tests.conftest import register
+
+def test_bulk_caps_password_hashes(client, monkeypatch):
+    headers = register(client, "alice")
+    monkeypatch.setattr(server, "BULK_PASSWORD_LIMIT", 2)
+    links = [{"original_url": f"https://example.com/{index}", "password": "secret"} for index in range(3)]
+
+    response = client.post("/api/links/bulk", json={"links": links}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.post("/api/links/bulk", json={"links": links[:2]}, headers=headers)
+    assert response.status_code == 200
+    assert all(link["has_password"] for link in response.json()["links"])
+
+def test_bulk_hashes_off_the_event_loop(client, monkeypatch):
+    threads = []
+
+    def hash_password(password):
+        threads.append(server.threading.get_ident())
+        return "hashed"
+
+    headers = register(client, "alice")
+    monkeypatch.setattr(server, "hash_password", hash_password)
+    loop_thread = client.portal.call(server.threading.get_ident)
+
+    links = [{"original_url": f"https://example.com/{index}", "password": "secret"} for index in range(2)]
+    assert client.post("/api/links/bulk", json={"links": links}, headers=headers).status_code == 200
+    assert len(threads) == 2
+    assert loop_thread not in threads
+
+def test_qr_renders_in_spawned_pool(client):
+    client.portal.call(server.warm_qr_cache, ["spawned"])
+    key = server.QRCache.key("spawned", 256, "png", "000000", "ffffff")
+    assert client.portal.call(server.qr_cache.get, key, "png").startswith(b"\x89PNG")
+    assert server.get_qr_pool()._mp_context.get_start_method() == "spawn"
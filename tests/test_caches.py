@@ -0,0 +1,52 @@
+import asyncio
+import os
+import stat
+
+import server
+
+def test_put_after_invalidate_is_not_cached():
+    cache = server.EntityCache(30, 10)
+    # A load starts, the row is updated and invalidated, then the load finishes
+    version = server.EntityCache.version()
+    cache.invalidate("abc", server.EntityCache.version())
+    cache.put("abc", {"stale": True}, version)
+    assert cache.get("abc") is None
+
+    cache.put("abc", {"stale": False}, server.EntityCache.version())
+    assert cache.get("abc") == {"stale": False}
+
+def test_older_invalidation_keeps_newer_tombstone():
+    cache = server.EntityCache(30, 10)
+    cache.invalidate("abc", 200)
+    cache.invalidate("abc", 100)
+    assert cache.invalidated["abc"] == 200
+
+def test_apply_message_from_another_worker():
+    cache = server.EntityCache(30, 10)
+    bus = server.InvalidationBus(server.NullChannel())
+    bus.register("link", cache)
+    cache.put("abc", {"id": "1"}, server.EntityCache.version())
+
+    bus.apply({"kind": "link", "key": "abc", "version": server.EntityCache.version()})
+    assert cache.get("abc") is None
+    bus.apply({"kind": "user", "key": "abc", "version": server.EntityCache.version()})
+
+def test_unix_socket_round_trip(tmp_path):
+    directory = str(tmp_path / "bus")
+
+    async def round_trip():
+        received = asyncio.Queue()
+        sender = server.UnixSocketChannel(directory)
+        receiver = server.UnixSocketChannel(directory)
+        await sender.start(lambda message: None)
+        await receiver.start(received.put_nowait)
+        try:
+            await sender.send({"kind": "link", "key": "abc", "version": 1})
+            return await asyncio.wait_for(received.get(), 1)
+        finally:
+            await sender.stop()
+            await receiver.stop()
+
+    assert asyncio.run(round_trip()) == {"kind": "link", "key": "abc", "version": 1}
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert os.listdir(directory) == []
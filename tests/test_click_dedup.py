@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+import server
+
+UA = "Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0"
+
+def test_duplicate_within_window():
+    deduper = server.ClickDeduper(10, 100)
+    assert deduper.seen("a", "198.51.100.1", UA) is False
+    assert deduper.seen("a", "198.51.100.1", UA) is True
+    # Another link, address or browser is a different visitor
+    assert deduper.seen("b", "198.51.100.1", UA) is False
+    assert deduper.seen("a", "198.51.100.2", UA) is False
+    assert deduper.pending == {"a": 1}
+
+def test_still_duplicate_after_one_window_expired_after_two():
+    deduper = server.ClickDeduper(10, 100)
+    deduper.seen("a", "198.51.100.1", UA)
+    deduper.rotated_at -= 15
+    # Rotated into the previous generation, still remembered
+    assert deduper.seen("a", "198.51.100.1", UA) is True
+
+    deduper.seen("b", "198.51.100.1", UA)
+    deduper.rotated_at -= 25
+    assert deduper.seen("b", "198.51.100.1", UA) is False
+    assert deduper.stats["rotations"] == 2
+
+def test_full_generation_rotates_early():
+    deduper = server.ClickDeduper(10, 2)
+    deduper.seen("a", "198.51.100.1", UA)
+    deduper.seen("a", "198.51.100.2", UA)
+    assert deduper.stats["rotations"] == 0
+
+    assert deduper.seen("a", "198.51.100.3", UA) is False
+    assert deduper.stats["rotations"] == 1
+    assert len(deduper.current) == 1 and len(deduper.previous) == 2
+    assert deduper.seen("a", "198.51.100.1", UA) is True
+
+    # A second early rotation drops the oldest generation
+    deduper.seen("a", "198.51.100.4", UA)
+    deduper.seen("a", "198.51.100.5", UA)
+    assert deduper.seen("a", "198.51.100.1", UA) is False
+
+async def unavailable(hits):
+    raise sqlite3.OperationalError("database is locked")
+
+def test_failed_flush_keeps_counts(client, monkeypatch):
+    written = []
+
+    async def add_duplicate_hits(hits):
+        written.append(dict(hits))
+
+    deduper = server.ClickDeduper(10, 100)
+    deduper.pending = {"a": 2}
+    with monkeypatch.context() as patched:
+        patched.setattr(server.storage.links, "add_duplicate_hits", unavailable)
+        with pytest.raises(sqlite3.OperationalError):
+            client.portal.call(deduper.flush)
+    assert deduper.pending == {"a": 2}
+
+    monkeypatch.setattr(server.storage.links, "add_duplicate_hits", add_duplicate_hits)
+    client.portal.call(deduper.flush)
+    assert written == [{"a": 2}]
+    assert deduper.pending == {}
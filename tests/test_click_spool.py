@@ -0,0 +1,43 @@
+import asyncio
+import sqlite3
+
+import server
+from tests.conftest import register
+
+UA = {"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"}
+
+async def unavailable(*args):
+    raise sqlite3.OperationalError("database is locked")
+
+def test_snapshot_copies_links_on_start(client, tmp_path, monkeypatch):
+    headers = register(client, "alice")
+    client.post("/api/links", json={"original_url": "https://example.com/a", "custom_slug": "cold"}, headers=headers)
+    # An interval longer than the host's uptime
+    monkeypatch.setattr(server, "SPOOL_SNAPSHOT_REFRESH_SECONDS", server.time.monotonic() + 3600)
+
+    async def run_snapshot():
+        snapshot = server.LinkSnapshot(tmp_path / "links.db")
+        await snapshot.start()
+        await asyncio.sleep(0.2)
+        link = await snapshot.get("cold")
+        await snapshot.stop()
+        return snapshot.stats["refreshed"], link
+
+    refreshed, link = client.portal.call(run_snapshot)
+    assert refreshed == 1
+    assert link["original_url"] == "https://example.com/a"
+
+def test_failed_increment_is_replayed(client, monkeypatch):
+    headers = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+
+    with monkeypatch.context() as patched:
+        patched.setattr(server.storage.links, "increment_clicks", unavailable)
+        assert client.get(f"/api/r/{link['short_code']}", headers=UA, follow_redirects=False).status_code == 302
+    assert server.click_spool.stats["increments_spooled"] == 1
+    assert client.get(f"/api/links/{link['id']}", headers=headers).json()["click_count"] == 0
+
+    server.db_health.retry_at = 0
+    client.portal.call(server.click_spool.replay)
+    assert client.get(f"/api/links/{link['id']}", headers=headers).json()["click_count"] == 1
+    assert client.get(f"/api/links/{link['id']}/analytics", headers=headers).json()["total_clicks"] == 1
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+import server
+from tests.conftest import register
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://Example.COM:443/Path?q=1#top", "https://example.com/Path?q=1#top"),
+    ("http://example.com:80", "http://example.com/"),
+    ("http://example.com:8080/a", "http://example.com:8080/a"),
+    ("  https://user:pw@Example.com/a ", "https://user:pw@example.com/a"),
+])
+def test_normalize_url(url, expected):
+    assert server.normalize_url(url) == expected
+
+def test_url_hash_ignores_case_of_host_but_not_path():
+    assert server.url_hash("https://EXAMPLE.com/a") == server.url_hash("https://example.com:443/a")
+    assert server.url_hash("https://example.com/a") != server.url_hash("https://example.com/A")
+    assert len(server.url_hash("https://example.com/a")) == 32
+
+def test_find_reusable_skips_protected_and_inactive_links(client):
+    headers = register(client, "alice")
+    user_id = client.get("/api/auth/me", headers=headers).json()["id"]
+    destination = server.url_hash("https://example.com/a")
+
+    client.post("/api/links", json={"original_url": "https://example.com/a", "password": "secret"}, headers=headers)
+    assert client.portal.call(server.storage.links.find_reusable, user_id, destination) is None
+
+    plain = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+    assert client.portal.call(server.storage.links.find_reusable, user_id, destination)["id"] == plain["id"]
+
+    client.portal.call(server.storage.links.update, plain["id"], {"is_active": False})
+    assert client.portal.call(server.storage.links.find_reusable, user_id, destination) is None
+
+def test_bulk_reuses_existing_links(client):
+    headers = register(client, "alice")
+    first = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+    links = [{"original_url": "https://EXAMPLE.com/a"}, {"original_url": "https://example.com/b"}]
+
+    created = client.post("/api/links/bulk", json={"links": links, "reuse_existing": True}, headers=headers).json()["links"]
+    assert created[0]["id"] == first["id"] and created[0]["reused"] is True
+    assert not created[1].get("reused")
+
+    created = client.post("/api/links/bulk", json={"links": links}, headers=headers).json()["links"]
+    assert created[0]["id"] != first["id"]
+
+def test_mongo_backfill_runs_once():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient()["besturl"]
+    mongo = server.MongoStorage(database)
+    runs = []
+
+    async def backfill():
+        runs.append(1)
+
+    async def boot_twice():
+        await mongo.migrate("link_derived_fields", backfill)
+        await mongo.migrate("link_derived_fields", backfill)
+
+    asyncio.run(boot_twice())
+    assert runs == [1]
@@ -0,0 +1,98 @@
+import asyncio
+
+import server
+from tests.conftest import register
+
+class RecordingChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message: dict):
+        self.sent.append(message)
+
+def make_broker(monkeypatch) -> server.MongoLiveBroker:
+    broker = server.MongoLiveBroker(server.LiveHub())
+    broker.channel = RecordingChannel()
+    monkeypatch.setattr(server, "live_broker", broker)
+    return broker
+
+def test_unwatched_clicks_are_not_published(monkeypatch):
+    broker = make_broker(monkeypatch)
+    asyncio.run(server.publish_click("a", {"id": "c1"}))
+    assert broker.channel.sent == []
+
+def test_clicks_published_while_another_worker_watches(monkeypatch):
+    broker = make_broker(monkeypatch)
+    broker.receive({"watch": "a"})
+    asyncio.run(server.publish_click("a", {"id": "c1"}))
+    assert [message["link_id"] for message in broker.channel.sent] == ["a"]
+
+    # Announcements stopped, e.g. the dashboard was closed
+    broker.watched["a"] = server.time.monotonic() - 1
+    assert not broker.wants("a")
+
+def test_local_subscriber_announces_and_receives(monkeypatch):
+    broker = make_broker(monkeypatch)
+    queue = broker.hub.subscribe("a")
+    asyncio.run(broker.watch("a"))
+    assert broker.channel.sent == [{"watch": "a"}]
+
+    broker.receive({"link_id": "a", "event": {"click": {"id": "c1"}}})
+    assert queue.get_nowait() == {"click": {"id": "c1"}}
+
+def test_slow_consumer_is_dropped():
+    hub = server.LiveHub(queue_size=2)
+    slow, fast = hub.subscribe("a"), hub.subscribe("a")
+    hub.dispatch("a", {"n": 1})
+    hub.dispatch("a", {"n": 2})
+    fast.get_nowait()
+    fast.get_nowait()
+    hub.dispatch("a", {"n": 3})
+
+    # The backlog is discarded and only the sentinel is left
+    assert slow.qsize() == 1 and slow.get_nowait() is None
+    assert fast.get_nowait() == {"n": 3}
+    assert hub.subscribers["a"] == {fast}
+
+def stream_link(client, monkeypatch) -> dict:
+    headers = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+    hub = server.LiveHub(queue_size=2)
+
+    async def watch(link_id):
+        # One click, then a burst the stream cannot keep up with ends it
+        hub.dispatch(link_id, {"id": "c1"})
+
+        async def burst():
+            await asyncio.sleep(0.05)
+            for index in range(3):
+                hub.dispatch(link_id, {"id": f"burst-{index}"})
+
+        asyncio.get_running_loop().create_task(burst())
+
+    monkeypatch.setattr(server, "live_hub", hub)
+    monkeypatch.setattr(server.live_broker, "watch", watch)
+    return {"link": link, "headers": headers, "hub": hub}
+
+def test_sse_stream_with_stream_token(client, monkeypatch):
+    setup = stream_link(client, monkeypatch)
+    link_id = setup["link"]["id"]
+    token = client.post(f"/api/links/{link_id}/stream-token", headers=setup["headers"]).json()["token"]
+
+    response = client.get(f"/api/links/{link_id}/live", params={"token": token})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events == ["snapshot", "click", "dropped"]
+    assert not setup["hub"].has_subscribers(link_id)
+
+def test_query_token_must_be_a_stream_token_for_that_link(client, monkeypatch):
+    setup = stream_link(client, monkeypatch)
+    session = setup["headers"]["Authorization"].split(" ", 1)[1]
+    other = client.post("/api/links", json={"original_url": "https://example.com/b"}, headers=setup["headers"]).json()
+    other_token = client.post(f"/api/links/{other['id']}/stream-token", headers=setup["headers"]).json()["token"]
+
+    assert client.get(f"/api/links/{setup['link']['id']}/qr", params={"token": session}).status_code == 401
+    assert client.get(f"/api/links/{setup['link']['id']}/qr", params={"token": other_token}).status_code == 401
+    assert client.get(f"/api/links/{other['id']}/qr", params={"token": other_token}).status_code == 200
+    # Nor does a stream token work as a session
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {other_token}"}).status_code == 401
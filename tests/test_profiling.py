@@ -0,0 +1,53 @@
+import asyncio
+
+import server
+
+def admin_headers(client) -> dict:
+    response = client.post("/api/auth/login", json={"username": "venomcomeback", "password": "change_me_in_production"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_toggle_is_broadcast(client, monkeypatch):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    monkeypatch.setattr(server.invalidation_bus.channel, "send", send)
+    monkeypatch.setattr(server.profiler, "slow_ms", server.profiler.slow_ms)
+    headers = admin_headers(client)
+    try:
+        response = client.put("/api/admin/profiling", json={"enabled": True, "slow_ms": 250}, headers=headers)
+        assert response.json()["enabled"] is True
+        assert sent[-1]["type"] == "config"
+        assert sent[-1]["name"] == "profiling"
+        assert sent[-1]["settings"] == {"enabled": True, "slow_ms": 250}
+    finally:
+        client.portal.call(server.profiler.disable)
+
+def test_toggle_received_from_another_worker(client, monkeypatch):
+    monkeypatch.setattr(server.profiler, "loop_lag_ms", server.profiler.loop_lag_ms)
+    message = {"type": "config", "name": "profiling", "settings": {"enabled": True, "loop_lag_ms": 75}, "version": server.EntityCache.version()}
+
+    async def receive():
+        server.invalidation_bus.apply(message)
+        await asyncio.sleep(0.05)
+        return server.profiler.enabled, server.profiler.loop_lag_ms
+
+    try:
+        assert client.portal.call(receive) == (True, 75)
+    finally:
+        client.portal.call(server.profiler.disable)
+
+def test_older_toggle_is_ignored(client, monkeypatch):
+    monkeypatch.setattr(server.profiler, "slow_ms", server.profiler.slow_ms)
+    version = server.EntityCache.version()
+    newer = {"type": "config", "name": "profiling", "settings": {"slow_ms": 300}, "version": version}
+    older = {"type": "config", "name": "profiling", "settings": {"slow_ms": 100}, "version": version - 1}
+
+    async def receive():
+        server.invalidation_bus.apply(newer)
+        server.invalidation_bus.apply(older)
+        await asyncio.sleep(0.05)
+        return server.profiler.slow_ms
+
+    assert client.portal.call(receive) == 300
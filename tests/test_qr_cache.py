@@ -0,0 +1,26 @@
+import os
+
+import server
+from tests.conftest import register
+
+def test_key_depends_on_base_url(monkeypatch):
+    key = server.QRCache.key("abc", 256, "png", "000000", "ffffff")
+    monkeypatch.setattr(server, "PUBLIC_BASE_URL", "https://example.com")
+    assert server.QRCache.key("abc", 256, "png", "000000", "ffffff") != key
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = server.QRCache(tmp_path, 10, 2500)
+    for index, key in enumerate(("aa01", "bb02", "cc03")):
+        cache._write_disk(key, "png", b"x" * 1000)
+        os.utime(cache._path(key, "png"), (index, index))
+
+    assert not cache._path("aa01", "png").exists()
+    assert cache._path("cc03", "png").exists()
+    assert cache.disk_bytes <= 2500
+
+def test_qr_response_is_private(client):
+    headers = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+    response = client.get(f"/api/links/{link['id']}/qr", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["cache-control"].startswith("private")
@@ -0,0 +1,86 @@
+import ipaddress
+
+from starlette.requests import Request
+
+import server
+from tests.conftest import register
+
+def make_request(peer: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 1234)})
+
+def test_login_rejected_before_lookup_and_bcrypt(client, monkeypatch):
+    calls = []
+
+    async def get_by_username(username):
+        calls.append("lookup")
+
+    def verify_password(password, hashed):
+        calls.append("bcrypt")
+        return False
+
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_IP_SCOPE", True)
+    monkeypatch.setitem(server.rate_limiter.policies, "login", {"ip": [0.001, 1]})
+    monkeypatch.setattr(server.storage.users, "get_by_username", get_by_username)
+    monkeypatch.setattr(server, "verify_password", verify_password)
+
+    assert client.post("/api/auth/login", json={"username": "alice", "password": "x"}).status_code == 401
+    calls.clear()
+    response = client.post("/api/auth/login", json={"username": "alice", "password": "x"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"]
+    assert calls == []
+
+def test_register_rejected_before_bcrypt(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_IP_SCOPE", True)
+    monkeypatch.setitem(server.rate_limiter.policies, "register", {"ip": [0.001, 1]})
+    monkeypatch.setattr(server, "hash_password", lambda password: calls.append("bcrypt") or "x")
+
+    client.post("/api/auth/register", json={"username": "a", "email": "a@example.com", "password": "x"})
+    calls.clear()
+    response = client.post("/api/auth/register", json={"username": "b", "email": "b@example.com", "password": "x"})
+    assert response.status_code == 429
+    assert calls == []
+
+def test_without_trusted_proxies_only_ip_scope_is_skipped(client, monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_IP_SCOPE", False)
+    monkeypatch.setitem(server.rate_limiter.policies, "login", {"ip": [0.001, 1], "user": [0.001, 2]})
+
+    # Different users from the same (proxy) address are not throttled together
+    for username in ("alice", "bob", "carol"):
+        assert client.post("/api/auth/login", json={"username": username, "password": "x"}).status_code == 401
+    # One user is still throttled
+    assert client.post("/api/auth/login", json={"username": "alice", "password": "x"}).status_code == 401
+    assert client.post("/api/auth/login", json={"username": "alice", "password": "x"}).status_code == 429
+
+def test_client_ip_ignores_untrusted_forwarded_header(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [])
+    assert server.client_ip(make_request("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+
+def test_client_ip_from_trusted_proxy_chain(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    # Spoofed left-most entry, real client, then a second internal hop
+    request = make_request("10.0.0.2", "1.2.3.4, 198.51.100.1, 10.0.0.9")
+    assert server.client_ip(request) == "198.51.100.1"
+    assert server.client_ip(make_request("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+
+def test_bcrypt_runs_off_the_event_loop(client, monkeypatch):
+    threads = []
+
+    def verify_password(password, hashed):
+        threads.append(server.threading.get_ident())
+        return False
+
+    headers = register(client, "alice")
+    client.post("/api/links", json={"original_url": "https://example.com/a", "custom_slug": "locked", "password": "one"}, headers=headers)
+    monkeypatch.setattr(server, "verify_password", verify_password)
+    loop_thread = client.portal.call(server.threading.get_ident)
+
+    assert client.post("/api/auth/login", json={"username": "alice", "password": "x"}).status_code == 401
+    assert client.post("/api/r/locked/verify", json={"password": "x"}).status_code == 401
+    assert len(threads) == 2
+    assert loop_thread not in threads
@@ -0,0 +1,45 @@
+import server
+from tests.conftest import register
+
+RANGE = {"start": "2025-01-01T00:00:00Z", "end": "2025-01-03T00:00:00Z"}
+
+def totals(client, headers: dict, link_id: str) -> tuple:
+    single = client.get(f"/api/links/{link_id}/analytics", params=RANGE, headers=headers).json()
+    batch = client.post("/api/analytics/batch", json={"link_ids": [link_id], **RANGE}, headers=headers).json()
+    return single["total_clicks"], batch["combined"]["total_clicks"]
+
+def test_range_totals_survive_compaction(client):
+    headers = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+    for index, day in enumerate(("2025-01-01", "2025-01-02", "2025-01-03")):
+        click = {"id": f"click-{index}", "link_id": link["id"], "timestamp": f"{day}T10:00:00+00:00", "device_type": "desktop"}
+        client.portal.call(server.storage.clicks.insert, click)
+
+    assert totals(client, headers, link["id"]) == (2, 2)
+    summary = client.portal.call(server.run_retention, 30)
+    assert summary["clicks"] == 3
+    assert totals(client, headers, link["id"]) == (2, 2)
+
+def test_offset_range_is_converted_to_utc(client):
+    headers = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+    for index, timestamp in enumerate(("2025-01-01T20:30:00+00:00", "2025-01-01T21:30:00+00:00")):
+        client.portal.call(server.storage.clicks.insert, {"id": f"click-{index}", "link_id": link["id"], "timestamp": timestamp})
+
+    # Midnight in +03:00 is 21:00 UTC the day before
+    params = {"start": "2025-01-02T00:00:00+03:00"}
+    assert server.as_utc(server.datetime.fromisoformat(params["start"])).isoformat() == "2025-01-01T21:00:00+00:00"
+    assert client.get(f"/api/links/{link['id']}/analytics", params=params, headers=headers).json()["total_clicks"] == 1
+
+def test_run_skipped_while_another_worker_holds_the_lock(client):
+    headers = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/a"}, headers=headers).json()
+    client.portal.call(server.storage.clicks.insert, {"id": "click-0", "link_id": link["id"], "timestamp": "2025-01-01T10:00:00+00:00"})
+
+    held = server.lock_retention_archive()
+    try:
+        summary = client.portal.call(server.run_retention, 30)
+    finally:
+        held.close()
+    assert summary["skipped"] is True
+    assert client.portal.call(server.run_retention, 30)["clicks"] == 1
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+import server
+from tests.conftest import register
+
+LONG_URL = "https://example.com/landing?" + "&".join(f"utm_{index}={index:04x}" for index in range(170)) + "&campaign=springsale"
+
+def test_grams_are_capped():
+    fields = server.link_search_fields({"title": "Launch", "original_url": LONG_URL})
+    assert len(LONG_URL) > 2000
+    assert fields["search_partial"] is True
+    assert len(fields["search_grams"]) <= 2 * server.SEARCH_GRAM_CHARS
+    assert server.link_search_fields({"title": "Launch", "original_url": "https://example.com"})["search_partial"] is False
+
+def test_search_matches_title_url_and_short_code(client):
+    headers = register(client, "alice")
+    client.post("/api/links", json={"original_url": "https://example.com/docs", "title": "Product Docs", "custom_slug": "docs1"}, headers=headers)
+    client.post("/api/links", json={"original_url": LONG_URL, "title": "Spring"}, headers=headers)
+    client.post("/api/links", json={"original_url": "https://example.org/blog", "title": "Blog"}, headers=headers)
+
+    def search(q: str) -> list:
+        return sorted(link["title"] for link in client.get("/api/links/search", params={"q": q}, headers=headers).json()["items"])
+
+    assert search("product docs") == ["Product Docs"]
+    assert search("doc") == ["Product Docs"]
+    assert search("example.org") == ["Blog"]
+    assert search("springsale") == ["Spring"]
+    assert search("missing") == []
+
+def test_mongo_search_finds_text_past_the_gram_cap():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    repository = server.MongoLinkRepository(mongomock_motor.AsyncMongoMockClient()["besturl"])
+
+    async def scenario():
+        for index, url in enumerate((LONG_URL, "https://example.com/other")):
+            await repository.insert({"id": f"l{index}", "user_id": "u", "short_code": f"s{index}", "title": "t", "original_url": url, "created_at": f"2025-01-0{index + 1}"})
+        return [link["id"] for link in await repository.search("u", "springsale")], await repository.search("u", "other")
+
+    long_match, short_match = asyncio.run(scenario())
+    assert long_match == ["l0"]
+    assert [link["id"] for link in short_match] == ["l1"]
+    assert "search_grams" not in short_match[0] and "search_partial" not in short_match[0]
@@ -0,0 +1,35 @@
+import sqlite3
+
+import pytest
+
+import server
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "t.db"), isolation_level=None)
+    conn.execute("CREATE TABLE t (id TEXT PRIMARY KEY)")
+    yield conn
+    conn.close()
+
+def test_transaction_is_opened(conn):
+    with server.sqlite_transaction(conn):
+        assert conn.in_transaction
+        conn.execute("INSERT INTO t (id) VALUES ('a')")
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+
+def test_transaction_rolls_back_on_error(conn):
+    with pytest.raises(sqlite3.IntegrityError):
+        with server.sqlite_transaction(conn):
+            conn.execute("INSERT INTO t (id) VALUES ('a')")
+            conn.execute("INSERT INTO t (id) VALUES ('a')")
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+def test_failed_batch_leaves_no_rows(client):
+    database = server.storage.database
+    rows = [("b", "bob"), ("b", "bobby")]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        client.portal.call(database.executemany, "INSERT INTO users (id, username) VALUES (?, ?)", rows)
+    assert client.portal.call(database.scalar, "SELECT COUNT(*) FROM users WHERE id = 'b'") == 0
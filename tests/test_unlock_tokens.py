@@ -0,0 +1,39 @@
+from tests.conftest import register
+
+def unlock(client, short_code: str, password: str) -> str:
+    response = client.post(f"/api/r/{short_code}/verify", json={"password": password})
+    assert response.status_code == 200
+    return response.json()["unlock_token"]
+
+def redirect(client, short_code: str, token: str):
+    client.cookies.clear()
+    return client.get(f"/api/r/{short_code}", params={"unlock": token}, follow_redirects=False)
+
+def test_token_skips_password(client):
+    headers = register(client, "alice")
+    client.post("/api/links", json={"original_url": "https://example.com/a", "custom_slug": "team", "password": "one"}, headers=headers)
+    token = unlock(client, "team", "one")
+
+    response = redirect(client, "team", token)
+    assert response.status_code == 302
+    assert response.headers["location"] == "https://example.com/a"
+
+def test_password_change_revokes_token(client):
+    headers = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/a", "custom_slug": "team", "password": "one"}, headers=headers).json()
+    token = unlock(client, "team", "one")
+
+    client.put(f"/api/links/{link['id']}", json={"password": "two"}, headers=headers)
+    assert redirect(client, "team", token).json()["requires_password"] is True
+
+def test_recreated_slug_rejects_old_token(client):
+    alice = register(client, "alice")
+    link = client.post("/api/links", json={"original_url": "https://example.com/alice", "custom_slug": "team", "password": "one"}, headers=alice).json()
+    token = unlock(client, "team", "one")
+    client.delete(f"/api/links/{link['id']}", headers=alice)
+
+    bob = register(client, "bob")
+    client.post("/api/links", json={"original_url": "https://example.com/bob", "custom_slug": "team", "password": "two"}, headers=bob)
+    response = redirect(client, "team", token)
+    assert response.status_code == 200
+    assert response.json()["requires_password"] is True